@@ -1,7 +1,220 @@
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.functional import cached_property
+from datetime import datetime, time, timedelta
+import json
+
 from .models import Grid, GridRegion, GridNode, Measures
 
 
+# Below this many (estimated) rows an exact COUNT(*) is cheap enough
+EXACT_COUNT_THRESHOLD = 100000
+
+
+def estimated_count(queryset):
+    """
+    Row count for admin pagination that avoids COUNT(*) over large tables.
+
+    On PostgreSQL an unfiltered queryset uses the planner statistics in
+    pg_class.reltuples and a filtered one the row estimate of its query
+    plan. Small results and other databases fall back to an exact count.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    if not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        estimate = row[0] if row else -1
+    else:
+        plan = json.loads(queryset.explain(format='json'))
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+
+    if estimate < EXACT_COUNT_THRESHOLD:
+        return queryset.count()
+    return estimate
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator whose count comes from `estimated_count`"""
+
+    @cached_property
+    def count(self):
+        return estimated_count(self.object_list)
+
+
+class RecentRangeListFilter(admin.SimpleListFilter):
+    """
+    Bounded date range filter. Unlike the default DateFieldListFilter it
+    only offers windows relative to now, so every choice is an index range
+    scan instead of a distinct scan over the whole column.
+    """
+    field_name = None
+    ranges = (
+        ('past_24h', 'Past 24 hours', timedelta(hours=-24), timedelta(0)),
+        ('past_7d', 'Past 7 days', timedelta(days=-7), timedelta(0)),
+        ('past_30d', 'Past 30 days', timedelta(days=-30), timedelta(0)),
+        ('next_24h', 'Next 24 hours', timedelta(0), timedelta(hours=24)),
+        ('next_7d', 'Next 7 days', timedelta(0), timedelta(days=7)),
+    )
+
+    def lookups(self, request, model_admin):
+        return [(key, label) for key, label, start, end in self.ranges]
+
+    def queryset(self, request, queryset):
+        for key, label, start, end in self.ranges:
+            if self.value() == key:
+                now = timezone.now()
+                return queryset.filter(**{
+                    f'{self.field_name}__gte': now + start,
+                    f'{self.field_name}__lt': now + end,
+                })
+        return queryset
+
+
+class TimestampRangeFilter(RecentRangeListFilter):
+    title = 'timestamp'
+    parameter_name = 'timestamp_range'
+    field_name = 'timestamp'
+
+
+class CollectedAtRangeFilter(RecentRangeListFilter):
+    title = 'collected at'
+    parameter_name = 'collected_at_range'
+    field_name = 'collected_at'
+
+
+class DateTimeRangeListFilter(admin.ListFilter):
+    """
+    Explicit from/to filter for historical ranges. The span is capped at
+    `max_range` so that it stays a bounded index range scan; a missing
+    bound defaults to the other one plus or minus the cap. Dates without a
+    time mean midnight in the current time zone.
+    """
+    template = 'admin/energy/datetime_range_filter.html'
+    field_name = None
+    max_range = timedelta(days=31)
+
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        self.parameter_from = f'{self.field_name}_from'
+        self.parameter_to = f'{self.field_name}_to'
+        self.used_parameters = {}
+        for name in self.expected_parameters():
+            if name in params:
+                value = params.pop(name)[-1]
+                if value:
+                    self.used_parameters[name] = value
+
+    def has_output(self):
+        return True
+
+    def expected_parameters(self):
+        return [self.parameter_from, self.parameter_to]
+
+    def parse(self, name):
+        value = self.used_parameters.get(name)
+        if value is None:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            try:
+                day = parse_date(value)
+            except ValueError:
+                day = None
+            if day is None:
+                raise IncorrectLookupParameters(f'Invalid {name}: {value}')
+            parsed = datetime.combine(day, time.min)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    def bounds(self):
+        """(start, end) of the selected range, end exclusive, or None"""
+        try:
+            start = self.parse(self.parameter_from)
+            end = self.parse(self.parameter_to)
+        except ValueError as exc:
+            raise IncorrectLookupParameters(exc)
+        if start is None and end is None:
+            return None
+        if start is None:
+            start = end - self.max_range
+        if end is None:
+            end = start + self.max_range
+        if not start < end <= start + self.max_range:
+            raise IncorrectLookupParameters(
+                f'{self.title} ranges must be positive and at most {self.max_range.days} days'
+            )
+        return start, end
+
+    def queryset(self, request, queryset):
+        bounds = self.bounds()
+        if bounds is None:
+            return queryset
+        return queryset.filter(**{
+            f'{self.field_name}__gte': bounds[0],
+            f'{self.field_name}__lt': bounds[1],
+        })
+
+    def choices(self, changelist):
+        yield {
+            'selected': not self.used_parameters,
+            'query_string': changelist.get_query_string(remove=self.expected_parameters()),
+            'display': 'All',
+        }
+        # Rendered as a GET form that keeps the other filters as hidden fields
+        yield {
+            'selected': bool(self.used_parameters),
+            'form': {
+                'from_name': self.parameter_from,
+                'from': self.used_parameters.get(self.parameter_from, ''),
+                'to_name': self.parameter_to,
+                'to': self.used_parameters.get(self.parameter_to, ''),
+                'hidden': [
+                    (name, value) for name, value in changelist.params.items()
+                    if name not in self.expected_parameters()
+                ],
+            },
+        }
+
+
+class TimestampDateRangeFilter(DateTimeRangeListFilter):
+    title = 'timestamp range'
+    field_name = 'timestamp'
+
+
+class CollectedAtDateRangeFilter(DateTimeRangeListFilter):
+    title = 'collected at range'
+    field_name = 'collected_at'
+
+
+class RegionListFilter(admin.RelatedFieldListFilter):
+    """Region filter that loads the grid names in the same query"""
+
+    def field_choices(self, field, request, model_admin):
+        regions = GridRegion.objects.select_related('grid').order_by('grid__name', 'name')
+        return [(region.pk, str(region)) for region in regions]
+
+
+class LargeTableAdminMixin:
+    """
+    Changelist settings for tables too large for exact counts: estimated
+    pagination and no full result count.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
 @admin.register(Grid)
 class GridAdmin(admin.ModelAdmin):
     list_display = ['name']
@@ -20,6 +233,11 @@ class GridNodeAdmin(admin.ModelAdmin):
     list_display = ['name', 'region', 'grid']
     list_filter = ['region__grid', 'region']
     search_fields = ['name', 'region__name', 'region__grid__name']
+    ordering = ['region__grid__name', 'region__name', 'name']
+
+    def get_queryset(self, request):
+        # Also used by the node autocomplete of MeasuresAdmin
+        return super().get_queryset(request).select_related('region__grid')
     
     def grid(self, obj):
         return obj.region.grid.name
@@ -27,11 +245,20 @@ class GridNodeAdmin(admin.ModelAdmin):
 
 
 @admin.register(Measures)
-class MeasuresAdmin(admin.ModelAdmin):
+class MeasuresAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ['node', 'grid', 'region', 'timestamp', 'collected_at', 'value']
-    list_filter = ['node__region__grid', 'node__region', 'timestamp', 'collected_at']
+    list_filter = [
+        'node__region__grid',
+        ('node__region', RegionListFilter),
+        TimestampRangeFilter,
+        TimestampDateRangeFilter,
+        CollectedAtRangeFilter,
+        CollectedAtDateRangeFilter,
+    ]
+    list_select_related = ['node__region__grid']
     search_fields = ['node__name', 'node__region__name', 'node__region__grid__name']
-    date_hierarchy = 'timestamp'
+    autocomplete_fields = ['node']
+    ordering = ['-timestamp', '-collected_at']
     
     def grid(self, obj):
         return obj.node.region.grid.name
@@ -0,0 +1,173 @@
+"""
+Completeness index for measures.
+
+NodeDayCompleteness keeps, per node and UTC day, a bitmask of the hours that
+have data and the latest collected_at of every hour. `record_measures` merges
+new writes into it, `rebuild_completeness` recomputes it from the measures
+table and `find_gaps` answers missing/stale hour questions from it alone.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.functions import TruncHour
+from django.utils.dateparse import parse_datetime
+
+from .models import Measures, NodeDayCompleteness
+
+HOURS_PER_DAY = 24
+
+
+def hour_slot(timestamp):
+    """(UTC day, hour) a timestamp belongs to"""
+    timestamp = timestamp.astimezone(dt_timezone.utc)
+    return timestamp.date(), timestamp.hour
+
+
+def _aggregate(entries):
+    """Group (node_id, timestamp, collected_at) into {(node_id, day): {hour: latest collected_at}}"""
+    slots = defaultdict(dict)
+    for node_id, timestamp, collected_at in entries:
+        day, hour = hour_slot(timestamp)
+        hours = slots[(str(node_id), day)]
+        if hour not in hours or collected_at > hours[hour]:
+            hours[hour] = collected_at
+    return slots
+
+
+def _merge(row, hours):
+    """Merge {hour: collected_at} into a NodeDayCompleteness row"""
+    last_collected = row.last_collected or [None] * HOURS_PER_DAY
+    for hour, collected_at in hours.items():
+        row.hour_mask |= 1 << hour
+        current = last_collected[hour]
+        if current is None or parse_datetime(current) < collected_at:
+            last_collected[hour] = collected_at.astimezone(dt_timezone.utc).isoformat()
+    row.last_collected = last_collected
+
+
+def record_measures(entries):
+    """
+    Mark the hours of (node_id, timestamp, collected_at) entries as present.
+    Used by every Measures write path; safe to call concurrently.
+    """
+    slots = _aggregate(entries)
+    if not slots:
+        return
+
+    node_ids = {node_id for node_id, day in slots}
+    days = {day for node_id, day in slots}
+    with transaction.atomic():
+        # Create missing rows first so that every row can be locked below.
+        # Rows are touched in a fixed order to avoid deadlocks between writers.
+        NodeDayCompleteness.objects.bulk_create(
+            [
+                NodeDayCompleteness(
+                    node_id=node_id, day=day, last_collected=[None] * HOURS_PER_DAY
+                )
+                for node_id, day in sorted(slots)
+            ],
+            ignore_conflicts=True,
+        )
+        rows = NodeDayCompleteness.objects.select_for_update().filter(
+            node_id__in=node_ids, day__in=days
+        ).order_by('node_id', 'day')
+        changed = []
+        for row in rows:
+            hours = slots.get((str(row.node_id), row.day))
+            if hours:
+                _merge(row, hours)
+                changed.append(row)
+        NodeDayCompleteness.objects.bulk_update(changed, ['hour_mask', 'last_collected'])
+
+
+def rebuild_completeness(node_ids, start_day, end_day):
+    """
+    Recompute the completeness rows of `node_ids` for days start_day to
+    end_day (inclusive) from the measures table.
+    """
+    start = datetime.combine(start_day, time.min, tzinfo=dt_timezone.utc)
+    end = datetime.combine(end_day + timedelta(days=1), time.min, tzinfo=dt_timezone.utc)
+
+    hours = Measures.objects.filter(
+        node_id__in=node_ids,
+        timestamp__gte=start,
+        timestamp__lt=end,
+    ).annotate(
+        hour=TruncHour('timestamp', tzinfo=dt_timezone.utc)
+    ).values('node_id', 'hour').annotate(
+        latest_collected=Max('collected_at')
+    ).values_list('node_id', 'hour', 'latest_collected')
+
+    slots = _aggregate(hours)
+    rows = []
+    for (node_id, day), day_hours in slots.items():
+        row = NodeDayCompleteness(node_id=node_id, day=day)
+        _merge(row, day_hours)
+        rows.append(row)
+
+    with transaction.atomic():
+        NodeDayCompleteness.objects.filter(
+            node_id__in=node_ids, day__gte=start_day, day__lte=end_day
+        ).delete()
+        NodeDayCompleteness.objects.bulk_create(rows)
+    return len(rows)
+
+
+def _ranges(hours):
+    """Collapse a sorted list of hourly datetimes into [{start, end, hours}] runs"""
+    runs = []
+    for hour in hours:
+        if runs and hour - runs[-1]['end'] == timedelta(hours=1):
+            runs[-1]['end'] = hour
+            runs[-1]['hours'] += 1
+        else:
+            runs.append({'start': hour, 'end': hour, 'hours': 1})
+    return runs
+
+
+def find_gaps(nodes, start, end, stale_before=None):
+    """
+    Missing and stale hours of `nodes` between start and end (inclusive).
+
+    An hour is missing when it has no measures at all, and stale when its
+    latest revision was collected before `stale_before`. Only the
+    completeness index is read.
+    """
+    start = start.astimezone(dt_timezone.utc)
+    end = end.astimezone(dt_timezone.utc)
+    first_hour = start.replace(minute=0, second=0, microsecond=0)
+    if first_hour < start:
+        first_hour += timedelta(hours=1)
+    expected = []
+    hour = first_hour
+    while hour <= end:
+        expected.append(hour)
+        hour += timedelta(hours=1)
+
+    rows = {
+        (row.node_id, row.day): row
+        for row in NodeDayCompleteness.objects.filter(
+            node__in=nodes, day__gte=start.date(), day__lte=end.date()
+        )
+    }
+
+    gaps = []
+    for node in nodes:
+        missing = []
+        stale = []
+        for hour in expected:
+            row = rows.get((node.id, hour.date()))
+            if row is None or not row.hour_mask & (1 << hour.hour):
+                missing.append(hour)
+            elif stale_before and parse_datetime(row.last_collected[hour.hour]) < stale_before:
+                stale.append(hour)
+        gaps.append({
+            'node': node,
+            'missing_hours': len(missing),
+            'stale_hours': len(stale),
+            'missing': _ranges(missing),
+            'stale': _ranges(stale),
+        })
+    return len(expected), gaps
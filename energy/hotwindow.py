@@ -0,0 +1,413 @@
+"""
+Optional in-process store of the latest measures over a trailing window.
+
+When settings.MEASURES_HOT_WINDOW_DAYS is set, every process keeps one row
+per node of NumPy arrays with one slot per hour, holding the newest
+revision's value, collected_at and id. Latest-value queries that fall
+entirely inside the window are then answered by slicing these arrays
+instead of querying PostgreSQL.
+
+The store is loaded from Measures on startup (see gridbeyond/wsgi.py) and
+kept current by the Measures signal handlers and by polling for rows
+collected since the newest collected_at it has seen. Rows merged by
+import_measures, which may be older than that watermark, are announced by
+a MeasuresImport row; polling reloads the store when one overlaps the
+window. It is also reloaded whenever the window rolls over to a new day or
+the node hierarchy changes (in any process; polling compares it too).
+Reloads run in a background thread and queries use the database until the
+new arrays are swapped in.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal, ROUND_HALF_UP
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.models import Max
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .models import GridNode, Measures, MeasuresImport
+from .serializers import MeasuresResponseSerializer
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+HOUR_US = 3600 * 1000000
+# collected_at of slots without data (int64 minimum)
+EMPTY = -(2 ** 63)
+
+# value (int64) + collected_at (int64) + id (16 bytes)
+BYTES_PER_SLOT = 32
+
+# Measures.value precision; PostgreSQL rounds numeric half away from zero
+VALUE_QUANTUM = Decimal('0.001')
+
+# Replaced as a whole when the store is reloaded
+WINDOW_ATTRIBUTES = (
+    'window_day', 'window_start', 'window_end', 'hours', 'hierarchy', 'node_index', 'node_rank',
+    'node_ids', 'node_region_ids', 'node_grid_ids', 'node_names', 'region_names', 'grid_names',
+    'unaligned', 'values', 'collected', 'ids', 'watermark', 'last_import_id',
+)
+
+
+def to_us(value):
+    """Microseconds since the epoch, computed exactly"""
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_us(value):
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+class HotWindowStore:
+    """Latest value per node and hour over a trailing window"""
+
+    def __init__(self, days, forward_days, max_bytes, poll_seconds):
+        self.days = days
+        self.forward_days = forward_days
+        self.max_bytes = max_bytes
+        self.poll_seconds = poll_seconds
+        self.lock = threading.RLock()
+        self.load_lock = threading.Lock()
+        self.loaded = False
+        self.stale = True
+        self.reloading = False
+        # Writes recorded while a load is running, replayed onto the new arrays
+        self.pending = None
+        self.last_poll = None
+        self.watermark = None
+
+    def _today(self):
+        return datetime.now(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def _window_bounds(self, nodes):
+        """Start of the window and its number of hourly slots, evicting the oldest days over budget"""
+        today = self._today()
+        days = self.days
+        max_days = self.max_bytes // (max(nodes, 1) * 24 * BYTES_PER_SLOT) - self.forward_days
+        if max_days < days:
+            logger.warning(
+                'Hot window limited to %s trailing day(s) by MEASURES_HOT_WINDOW_MAX_MB', max_days
+            )
+            days = max_days
+        if days < 1:
+            return today, 0
+        return today - timedelta(days=days - 1), (days + self.forward_days) * 24
+
+    def load(self):
+        """
+        (Re)load node metadata and the whole window from the database. The new
+        arrays are built without holding the lock and swapped in when complete.
+        """
+        with self.load_lock:
+            with self.lock:
+                self.pending = []
+            try:
+                fresh = HotWindowStore(self.days, self.forward_days, self.max_bytes, self.poll_seconds)
+                fresh._fill()
+            except Exception:
+                with self.lock:
+                    self.pending = None
+                raise
+
+            with self.lock:
+                for name in WINDOW_ATTRIBUTES:
+                    setattr(self, name, getattr(fresh, name))
+                self.loaded = True
+                self.stale = fresh.stale
+                self.last_poll = time.monotonic()
+                pending, self.pending = self.pending, None
+                for replay in pending:
+                    replay()
+        logger.info(
+            'Hot window loaded: %s nodes x %s hours from %s',
+            len(self.node_index), self.hours, self.window_start.isoformat()
+        )
+
+    def _fill(self):
+        """Read node metadata and the whole window into this (not yet shared) store"""
+        nodes = list(GridNode.objects.select_related('region', 'region__grid').order_by('name', 'id'))
+        self.window_day = self._today()
+        self.window_start, self.hours = self._window_bounds(len(nodes))
+        self.window_end = self.window_start + self.hours * HOUR
+
+        self.hierarchy = [
+            (node.id, node.name, node.region_id, node.region.name, node.region.grid_id, node.region.grid.name)
+            for node in nodes
+        ]
+        self.node_index = {node.id: i for i, node in enumerate(nodes)}
+        # Position in the DB's (name, id) order, used to sort results like the DB path
+        self.node_rank = np.arange(len(nodes))
+        self.node_ids = np.array([node.id for node in nodes], dtype=object)
+        self.node_region_ids = np.array([node.region_id for node in nodes], dtype=object)
+        self.node_grid_ids = np.array([node.region.grid_id for node in nodes], dtype=object)
+        self.node_names = [node.name for node in nodes]
+        self.region_names = [node.region.name for node in nodes]
+        self.grid_names = [node.region.grid.name for node in nodes]
+        # Nodes with timestamps that are not on the hour cannot be served from the store
+        self.unaligned = np.zeros(len(nodes), dtype=bool)
+
+        shape = (len(nodes), self.hours)
+        self.values = np.zeros(shape, dtype=np.int64)
+        self.collected = np.full(shape, EMPTY, dtype=np.int64)
+        self.ids = np.zeros(shape, dtype='S16')
+        self.watermark = None
+        self.stale = False
+        # Imports committed after this are checked by poll()
+        self.last_import_id = MeasuresImport.objects.aggregate(last=Max('id'))['last'] or 0
+
+        if self.hours:
+            queryset = Measures.objects.filter(
+                timestamp__gte=self.window_start,
+                timestamp__lt=self.window_end,
+            )
+            if connection.features.can_distinct_on_fields:
+                queryset = queryset.latest_revisions()
+            rows = queryset.values_list('id', 'node_id', 'timestamp', 'collected_at', 'value')
+            for row in rows.iterator(chunk_size=10000):
+                self._apply(*row)
+
+    def start_reload(self):
+        """Load in a background thread unless a load is already running"""
+        with self.lock:
+            if self.reloading:
+                return
+            self.reloading = True
+        threading.Thread(target=self._background_load, name='hot-window-load', daemon=True).start()
+
+    def _background_load(self):
+        try:
+            self.load()
+        except Exception:
+            logger.exception('Loading the hot window failed; requests will use the database')
+        finally:
+            self.reloading = False
+            connection.close()
+
+    def _apply(self, measure_id, node_id, timestamp, collected_at, value):
+        """Store a revision if it is the newest for its slot"""
+        index = self.node_index.get(node_id)
+        if index is None:
+            # Unknown node: reload everything on the next request
+            self.stale = True
+            return
+        if not self.window_start <= timestamp < self.window_end:
+            return
+        offset, remainder = divmod(to_us(timestamp) - to_us(self.window_start), HOUR_US)
+        if remainder:
+            self.unaligned[index] = True
+            return
+
+        collected_us = to_us(collected_at)
+        if collected_us >= self.collected[index, offset]:
+            self.collected[index, offset] = collected_us
+            self.values[index, offset] = int(
+                Decimal(value).quantize(VALUE_QUANTUM, rounding=ROUND_HALF_UP).scaleb(3)
+            )
+            self.ids[index, offset] = measure_id.bytes
+        if self.watermark is None or collected_at > self.watermark:
+            self.watermark = collected_at
+
+    def record(self, measure):
+        """Signal hook: apply a saved Measures instance"""
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append(lambda: self.record(measure))
+            if self.loaded:
+                self._apply(
+                    measure.id, measure.node_id, measure.timestamp, measure.collected_at,
+                    measure.value
+                )
+
+    def reload_days(self, node_days):
+        """Signal hook: re-read the slots of (node_id, UTC day) pairs after deletes or moves"""
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append(lambda: self.reload_days(node_days))
+            if not self.loaded:
+                return
+            window_start_us = to_us(self.window_start)
+            cleared = set()
+            for node_id, day in node_days:
+                index = self.node_index.get(node_id)
+                if index is None:
+                    continue
+                day_start = datetime(day.year, day.month, day.day, tzinfo=dt_timezone.utc)
+                day_offset = (to_us(day_start) - window_start_us) // HOUR_US
+                first, last = max(day_offset, 0), min(day_offset + 24, self.hours)
+                if first >= last:
+                    continue
+                self.collected[index, first:last] = EMPTY
+                cleared.add((node_id, day))
+            if not cleared:
+                return
+
+            # One query over the bounding days, keeping the cleared node-days only
+            first_day = min(day for node_id, day in cleared)
+            last_day = max(day for node_id, day in cleared)
+            rows = Measures.objects.filter(
+                node_id__in={node_id for node_id, day in cleared},
+                timestamp__gte=datetime(first_day.year, first_day.month, first_day.day, tzinfo=dt_timezone.utc),
+                timestamp__lt=datetime(last_day.year, last_day.month, last_day.day, tzinfo=dt_timezone.utc) + DAY,
+            ).values_list('id', 'node_id', 'timestamp', 'collected_at', 'value')
+            for row in rows.iterator(chunk_size=10000):
+                if (row[1], row[2].astimezone(dt_timezone.utc).date()) in cleared:
+                    self._apply(*row)
+
+    def invalidate(self):
+        """Force a full reload before the next query (e.g. after hierarchy changes)"""
+        self.stale = True
+
+    def refresh(self):
+        """
+        Poll for newly collected rows, or start a background reload when stale
+        or rolled over. Returns False while the store cannot answer queries.
+        """
+        with self.lock:
+            if not self.stale and time.monotonic() - self.last_poll >= self.poll_seconds:
+                self.poll()
+            if self.stale or self._today() != self.window_day:
+                self.start_reload()
+                return False
+        return True
+
+    def poll(self):
+        """
+        Apply rows collected at or after the watermark, and mark the store stale
+        when the node hierarchy was changed (possibly by another process) or
+        import_measures merged rows into the window
+        """
+        with self.lock:
+            hierarchy = list(GridNode.objects.order_by('name', 'id').values_list(
+                'id', 'name', 'region_id', 'region__name', 'region__grid_id', 'region__grid__name'
+            ))
+            if hierarchy != self.hierarchy:
+                self.stale = True
+                return
+
+            imports = MeasuresImport.objects.filter(id__gt=self.last_import_id).values_list(
+                'id', 'first_timestamp', 'last_timestamp'
+            )
+            for import_id, first_timestamp, last_timestamp in imports:
+                self.last_import_id = max(self.last_import_id, import_id)
+                if first_timestamp < self.window_end and last_timestamp >= self.window_start:
+                    self.stale = True
+            if self.stale:
+                return
+
+            queryset = Measures.objects.filter(
+                timestamp__gte=self.window_start,
+                timestamp__lt=self.window_end,
+            )
+            if self.watermark is not None:
+                # >= because other nodes may share the watermark's collected_at
+                queryset = queryset.filter(collected_at__gte=self.watermark)
+            rows = queryset.values_list('id', 'node_id', 'timestamp', 'collected_at', 'value')
+            for row in rows.iterator(chunk_size=10000):
+                self._apply(*row)
+            self.last_poll = time.monotonic()
+
+    def query(self, start_datetime, end_datetime, node_id=None, region_id=None, grid_id=None):
+        """
+        Latest values between start_datetime and end_datetime (inclusive) in
+        the MeasuresResponseSerializer format, ordered like MeasuresAPIView.
+        Returns None when the store is not loaded yet, is being reloaded, or
+        the range or nodes cannot be served from it.
+        """
+        if not self.loaded or not self.refresh():
+            return None
+        with self.lock:
+            if not self.hours or start_datetime < self.window_start or end_datetime >= self.window_end:
+                return None
+
+            selected = np.ones(len(self.node_index), dtype=bool)
+            if node_id:
+                selected &= self.node_ids == node_id
+            if grid_id:
+                selected &= self.node_grid_ids == grid_id
+            if region_id:
+                selected &= self.node_region_ids == region_id
+            if (self.unaligned & selected).any():
+                return None
+
+            window_start_us = to_us(self.window_start)
+            first = -(-(to_us(start_datetime) - window_start_us) // HOUR_US)
+            last = (to_us(end_datetime) - window_start_us) // HOUR_US
+            if last < first:
+                return []
+
+            rows = np.flatnonzero(selected)
+            collected = self.collected[rows, first:last + 1]
+            node_pos, offsets = np.nonzero(collected != EMPTY)
+            nodes = rows[node_pos]
+            order = np.lexsort((self.node_rank[nodes], offsets))
+            nodes = nodes[order]
+            offsets = offsets[order] + first
+
+            collected = self.collected[nodes, offsets]
+            values = self.values[nodes, offsets]
+            ids = self.ids[nodes, offsets]
+            # A reload swaps these once the lock is released
+            node_names, region_names, grid_names = self.node_names, self.region_names, self.grid_names
+            window_start = self.window_start
+
+        fields = MeasuresResponseSerializer().fields
+        timestamp_field = fields['timestamp']
+        value_field = fields['value']
+        results = []
+        for node, offset, collected_us, value, measure_id in zip(nodes, offsets, collected, values, ids):
+            results.append({
+                'id': str(uuid.UUID(bytes=measure_id.ljust(16, b'\0'))),
+                'node_name': node_names[node],
+                'region_name': region_names[node],
+                'grid_name': grid_names[node],
+                'timestamp': timestamp_field.to_representation(window_start + int(offset) * HOUR),
+                'collected_at': timestamp_field.to_representation(from_us(collected_us)),
+                'value': value_field.to_representation(Decimal(int(value)).scaleb(-3)),
+            })
+        return results
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The process-wide store, or None when the hot window is disabled"""
+    global _store
+    if not settings.MEASURES_HOT_WINDOW_DAYS:
+        return None
+    if np is None:
+        raise ImproperlyConfigured('MEASURES_HOT_WINDOW_DAYS requires numpy (pip install numpy)')
+    with _store_lock:
+        if _store is None:
+            _store = HotWindowStore(
+                days=settings.MEASURES_HOT_WINDOW_DAYS,
+                forward_days=settings.MEASURES_HOT_WINDOW_FORWARD_DAYS,
+                max_bytes=settings.MEASURES_HOT_WINDOW_MAX_MB * 1024 * 1024,
+                poll_seconds=settings.MEASURES_HOT_WINDOW_POLL_SECONDS,
+            )
+        return _store
+
+
+def loaded_store():
+    """The store if it has been loaded in this process (used by signal handlers)"""
+    store = _store
+    return store if store is not None and store.loaded else None
+
+
+def warm_up():
+    """Load the store in the background so the server can start accepting requests"""
+    store = get_store()
+    if store is not None:
+        store.start_reload()
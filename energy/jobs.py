@@ -0,0 +1,243 @@
+"""
+Background execution of heavy measures queries.
+
+Jobs are stored as MeasuresQueryJob rows and run on a thread pool inside
+the web process, so no external broker is needed. Each job walks its date
+range in chunks of settings.MEASURES_JOBS_CHUNK_HOURS, appends every chunk
+to the result file and records its progress after each one.
+
+A maintenance thread per process refreshes the heartbeat of the jobs the
+process owns and removes expired results every
+MEASURES_JOBS_HEARTBEAT_SECONDS. Active jobs whose heartbeat is older than
+MEASURES_JOBS_ABANDONED_SECONDS belonged to a process that is gone and are
+failed. `python manage.py cleanup_measures_jobs` does the same cleanup from
+cron.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Measures, MeasuresQueryJob
+from .writers import FILE_EXTENSIONS, get_writer
+
+logger = logging.getLogger(__name__)
+
+# Result columns, matching MeasuresResponseSerializer
+RESULT_COLUMNS = [
+    'id', 'node_name', 'region_name', 'grid_name', 'timestamp', 'collected_at', 'value'
+]
+RESULT_LOOKUPS = [
+    'id', 'node__name', 'node__region__name', 'node__region__grid__name',
+    'timestamp', 'collected_at', 'value'
+]
+
+# pg_advisory_xact_lock key that serialises job submissions
+SUBMIT_LOCK_ID = 7305511
+
+_executor = None
+_executor_lock = threading.Lock()
+_maintenance = None
+# Ids of the pending and running jobs of this process
+_owned_jobs = set()
+_owned_jobs_lock = threading.Lock()
+
+
+class JobLimitExceeded(Exception):
+    """Raised when MEASURES_JOBS_MAX_ACTIVE jobs are already pending or running"""
+
+
+def get_executor():
+    global _executor
+    start_maintenance()
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.MEASURES_JOBS_MAX_WORKERS,
+                thread_name_prefix='measures-job',
+            )
+        return _executor
+
+
+def start_maintenance():
+    """Start this process's heartbeat and cleanup thread unless it is running"""
+    global _maintenance
+    with _executor_lock:
+        if _maintenance is None or not _maintenance.is_alive():
+            _maintenance = threading.Thread(
+                target=_maintenance_loop, name='measures-job-maintenance', daemon=True
+            )
+            _maintenance.start()
+
+
+def _maintenance_loop():
+    while True:
+        try:
+            heartbeat()
+            cleanup_expired_jobs()
+        except Exception:
+            logger.exception('Measures query job maintenance failed')
+        finally:
+            connection.close()
+        time.sleep(settings.MEASURES_JOBS_HEARTBEAT_SECONDS)
+
+
+def heartbeat():
+    """Mark the jobs owned by this process as alive"""
+    with _owned_jobs_lock:
+        job_ids = list(_owned_jobs)
+    if job_ids:
+        MeasuresQueryJob.objects.filter(
+            id__in=job_ids, status__in=MeasuresQueryJob.ACTIVE_STATUSES
+        ).update(heartbeat_at=timezone.now())
+
+
+def time_chunks(start, end, step):
+    """
+    Split [start, end] into (chunk_start, chunk_end, inclusive_end) ranges
+    of at most `step`. Only the last chunk includes its upper bound.
+    """
+    current = start
+    while current + step <= end:
+        yield current, current + step, False
+        current += step
+    yield current, end, True
+
+
+def submit_job(params, file_format):
+    """
+    Create a job for validated MeasuresQuerySerializer data (`params` in
+    its serialized form) and queue it once the transaction commits.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # Serialise the count and the insert so concurrent submissions
+            # cannot exceed the limit
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [SUBMIT_LOCK_ID])
+        fail_abandoned_jobs()
+        active = MeasuresQueryJob.objects.filter(
+            status__in=MeasuresQueryJob.ACTIVE_STATUSES
+        ).count()
+        if active >= settings.MEASURES_JOBS_MAX_ACTIVE:
+            raise JobLimitExceeded(
+                f'{settings.MEASURES_JOBS_MAX_ACTIVE} jobs are already pending or running'
+            )
+        job = MeasuresQueryJob.objects.create(params=params, format=file_format)
+        transaction.on_commit(lambda: _queue(job.id))
+    return job
+
+
+def _queue(job_id):
+    with _owned_jobs_lock:
+        _owned_jobs.add(job_id)
+    get_executor().submit(_run_in_worker, job_id)
+
+
+def _run_in_worker(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        with _owned_jobs_lock:
+            _owned_jobs.discard(job_id)
+        # Worker threads own their database connection
+        connection.close()
+
+
+def job_queryset(params):
+    """Build the measures queryset for a job, mirroring MeasuresAPIView"""
+    queryset = Measures.objects.for_hierarchy(
+        node_id=params.get('node_id'),
+        region_id=params.get('region_id'),
+        grid_id=params.get('grid_id'),
+    )
+    collected_datetime = params.get('collected_datetime')
+    if collected_datetime:
+        return queryset.filter(collected_at=parse_datetime(collected_datetime))
+    return queryset
+
+
+def run_job(job_id):
+    """Execute a job chunk by chunk and write its result file"""
+    job = MeasuresQueryJob.objects.get(id=job_id)
+    params = job.params
+    start = parse_datetime(params['start_datetime'])
+    end = parse_datetime(params['end_datetime'])
+    chunks = list(time_chunks(start, end, timedelta(hours=settings.MEASURES_JOBS_CHUNK_HOURS)))
+
+    path = Path(settings.MEASURES_JOBS_DIR) / f'{job.id}.{FILE_EXTENSIONS[job.format]}'
+    job.status = MeasuresQueryJob.STATUS_RUNNING
+    job.started_at = job.heartbeat_at = timezone.now()
+    job.chunks_total = len(chunks)
+    job.save(update_fields=['status', 'started_at', 'heartbeat_at', 'chunks_total'])
+
+    base = job_queryset(params)
+    try:
+        with get_writer(job.format, path, RESULT_COLUMNS) as writer:
+            for chunk_start, chunk_end, inclusive_end in chunks:
+                queryset = base.filter(timestamp__gte=chunk_start)
+                if inclusive_end:
+                    queryset = queryset.filter(timestamp__lte=chunk_end)
+                else:
+                    queryset = queryset.filter(timestamp__lt=chunk_end)
+                if not params.get('collected_datetime'):
+                    queryset = Measures.objects.filter(
+                        id__in=queryset.latest_revisions().values('id')
+                    )
+                # Ordered like MeasuresAPIView, node_id breaking ties between equal names
+                writer.write_batch(list(
+                    queryset.order_by('timestamp', 'node__name', 'node_id').values_list(*RESULT_LOOKUPS)
+                ))
+
+                job.chunks_done += 1
+                job.rows = writer.rows_written
+                job.heartbeat_at = timezone.now()
+                job.save(update_fields=['chunks_done', 'rows', 'heartbeat_at'])
+    except Exception as exc:
+        logger.exception('Measures query job %s failed', job.id)
+        job.status = MeasuresQueryJob.STATUS_FAILED
+        job.error = str(exc)
+    else:
+        job.status = MeasuresQueryJob.STATUS_SUCCEEDED
+        job.result_path = str(path)
+
+    job.finished_at = timezone.now()
+    job.expires_at = job.finished_at + timedelta(hours=settings.MEASURES_JOBS_RESULT_TTL_HOURS)
+    job.save(update_fields=['status', 'error', 'result_path', 'finished_at', 'expires_at'])
+
+
+def fail_abandoned_jobs():
+    """Fail active jobs whose owning process stopped sending heartbeats"""
+    now = timezone.now()
+    return MeasuresQueryJob.objects.filter(
+        status__in=MeasuresQueryJob.ACTIVE_STATUSES,
+        heartbeat_at__lt=now - timedelta(seconds=settings.MEASURES_JOBS_ABANDONED_SECONDS),
+    ).update(
+        status=MeasuresQueryJob.STATUS_FAILED,
+        error='Job was abandoned',
+        finished_at=now,
+        expires_at=now + timedelta(hours=settings.MEASURES_JOBS_RESULT_TTL_HOURS),
+    )
+
+
+def cleanup_expired_jobs():
+    """
+    Fail abandoned jobs and delete finished jobs past their TTL together
+    with their result files. Returns the number of deleted jobs.
+    """
+    fail_abandoned_jobs()
+    expired = MeasuresQueryJob.objects.filter(expires_at__lt=timezone.now())
+    for result_path in expired.exclude(result_path='').values_list('result_path', flat=True):
+        try:
+            os.remove(result_path)
+        except FileNotFoundError:
+            pass
+    return expired.delete()[0]
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from energy.jobs import cleanup_expired_jobs, fail_abandoned_jobs
+
+
+class Command(BaseCommand):
+    help = 'Fail abandoned measures query jobs and delete expired jobs with their result files'
+
+    def handle(self, *args, **options):
+        failed = fail_abandoned_jobs()
+        deleted = cleanup_expired_jobs()
+        self.stdout.write(self.style.SUCCESS(
+            f'Failed {failed} abandoned job(s), deleted {deleted} expired job(s)'
+        ))
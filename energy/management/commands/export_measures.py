@@ -0,0 +1,285 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import timezone as dt_timezone
+from concurrent.futures import as_completed
+from itertools import islice
+from pathlib import Path
+import hashlib
+import json
+import os
+import time
+
+from energy.models import GridNode, Measures
+from energy.parallel import process_pool
+from energy.writers import COLUMNS, FILE_EXTENSIONS, get_writer
+
+MANIFEST_NAME = 'manifest.json'
+# The manifest is rewritten at most this often while partitions finish, and once at the end
+MANIFEST_SAVE_SECONDS = 5
+
+
+def parse_aware_datetime(value):
+    """argparse type for ISO datetimes; naive values are taken as UTC"""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f'Invalid datetime: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed.astimezone(dt_timezone.utc)
+
+
+def month_ranges(start, end):
+    """
+    Split [start, end] into calendar months, yielding
+    (label, month_start, month_end, inclusive_end). Only the last month
+    includes its upper bound.
+    """
+    current = start
+    while True:
+        if current.month == 12:
+            next_month = current.replace(year=current.year + 1, month=1, day=1,
+                                         hour=0, minute=0, second=0, microsecond=0)
+        else:
+            next_month = current.replace(month=current.month + 1, day=1,
+                                         hour=0, minute=0, second=0, microsecond=0)
+        if next_month > end:
+            yield current.strftime('%Y-%m'), current, end, True
+            return
+        yield current.strftime('%Y-%m'), current, next_month, False
+        current = next_month
+
+
+def export_partition(task):
+    """
+    Export one node-month to a single file. Runs inside a worker process.
+    Returns (key, rows written, path); path is None for empty partitions,
+    which get no file.
+    """
+    queryset = Measures.objects.filter(
+        node_id=task['node_id'],
+        timestamp__gte=task['start'],
+    )
+    if task['inclusive_end']:
+        queryset = queryset.filter(timestamp__lte=task['end'])
+    else:
+        queryset = queryset.filter(timestamp__lt=task['end'])
+
+    if task['mode'] == 'all':
+        queryset = queryset.order_by('timestamp', 'collected_at')
+    else:
+        queryset = queryset.latest_revisions(collected_before=task['as_of'])
+
+    rows = queryset.values_list(*COLUMNS).iterator(chunk_size=task['batch_size'])
+    batch = list(islice(rows, task['batch_size']))
+    if not batch:
+        return task['key'], 0, None
+
+    with get_writer(task['format'], task['path']) as writer:
+        while batch:
+            writer.write_batch(batch)
+            batch = list(islice(rows, task['batch_size']))
+
+    return task['key'], writer.rows_written, task['path']
+
+
+class Command(BaseCommand):
+    help = 'Export measures to partitioned Parquet or gzip CSV files (one file per node-month)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            type=parse_aware_datetime,
+            required=True,
+            help='Start of the timestamp range (ISO format)'
+        )
+        parser.add_argument(
+            '--end',
+            type=parse_aware_datetime,
+            required=True,
+            help='End of the timestamp range, inclusive (ISO format)'
+        )
+        parser.add_argument('--node-id', help='Only export this node')
+        parser.add_argument('--region-id', help='Only export nodes of this region')
+        parser.add_argument('--grid-id', help='Only export nodes of this grid')
+        parser.add_argument(
+            '--mode',
+            choices=['latest', 'as-of', 'all'],
+            default='latest',
+            help='latest revision, latest revision collected at or before --as-of, '
+                 'or every revision (default: latest)'
+        )
+        parser.add_argument(
+            '--as-of',
+            type=parse_aware_datetime,
+            help='Collection cutoff for --mode as-of (ISO format)'
+        )
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'parquet'],
+            default='parquet',
+            help='Output file format (default: parquet)'
+        )
+        parser.add_argument(
+            '--output',
+            required=True,
+            help='Output directory; files are written to <output>/<node_id>/<YYYY-MM>.<ext>'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of worker processes (default: CPU count)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50000,
+            help='Rows fetched from the server-side cursor per batch (default: 50000)'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Skip partitions already recorded in the manifest of a previous run'
+        )
+
+    def handle(self, *args, **options):
+        start = options['start']
+        end = options['end']
+        mode = options['mode']
+        as_of = options['as_of']
+
+        if start > end:
+            raise CommandError('--start must be before --end')
+        if mode == 'as-of' and as_of is None:
+            raise CommandError('--as-of is required with --mode as-of')
+        if mode != 'as-of' and as_of is not None:
+            raise CommandError('--as-of can only be used with --mode as-of')
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers and --batch-size must be positive')
+        if options['format'] == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise CommandError('Parquet export requires pyarrow (pip install pyarrow)')
+
+        nodes = GridNode.objects.all()
+        if options['node_id']:
+            nodes = nodes.filter(id=options['node_id'])
+        if options['grid_id']:
+            nodes = nodes.filter(region__grid_id=options['grid_id'])
+        if options['region_id']:
+            nodes = nodes.filter(region_id=options['region_id'])
+        node_ids = [str(node_id) for node_id in nodes.order_by('id').values_list('id', flat=True)]
+        if not node_ids:
+            raise CommandError('No nodes match the given filters')
+
+        output = Path(options['output'])
+        output.mkdir(parents=True, exist_ok=True)
+        manifest_path = output / MANIFEST_NAME
+
+        params = {
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'mode': mode,
+            'as_of': as_of.isoformat() if as_of else None,
+            'format': options['format'],
+            'nodes': node_ids,
+        }
+        params_hash = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+        manifest = self._load_manifest(manifest_path, params, params_hash, options['resume'])
+
+        months = list(month_ranges(start, end))
+        extension = FILE_EXTENSIONS[options['format']]
+        tasks = []
+        for node_id in node_ids:
+            for label, month_start, month_end, inclusive_end in months:
+                key = f'{node_id}/{label}'
+                if key in manifest['completed']:
+                    continue
+                tasks.append({
+                    'key': key,
+                    'node_id': node_id,
+                    'start': month_start,
+                    'end': month_end,
+                    'inclusive_end': inclusive_end,
+                    'mode': mode,
+                    'as_of': as_of,
+                    'format': options['format'],
+                    'batch_size': options['batch_size'],
+                    'path': str(output / node_id / f'{label}.{extension}'),
+                })
+
+        total_partitions = len(node_ids) * len(months)
+        skipped = total_partitions - len(tasks)
+        self.stdout.write(
+            f'Exporting {len(tasks)} partition(s) for {len(node_ids)} node(s) '
+            f'with {options["workers"]} worker(s)'
+            + (f', {skipped} already done' if skipped else '')
+        )
+
+        started = time.monotonic()
+        last_save = started
+        rows_total = 0
+        with process_pool(options['workers']) as pool:
+            futures = [pool.submit(export_partition, task) for task in tasks]
+            try:
+                for done, future in enumerate(as_completed(futures), start=1):
+                    key, rows, path = future.result()
+                    rows_total += rows
+                    manifest['completed'][key] = {
+                        'rows': rows,
+                        'path': os.path.relpath(path, output) if path else None,
+                    }
+                    if time.monotonic() - last_save >= MANIFEST_SAVE_SECONDS:
+                        self._save_manifest(manifest_path, manifest)
+                        last_save = time.monotonic()
+                    if options['verbosity'] >= 2 or done % 100 == 0 or done == len(tasks):
+                        elapsed = time.monotonic() - started
+                        self.stdout.write(
+                            f'{done}/{len(tasks)} partitions, {rows_total} rows, '
+                            f'{rows_total / elapsed if elapsed else 0:,.0f} rows/sec'
+                        )
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+            finally:
+                # Keep the partitions finished so far for --resume, also when interrupted
+                self._save_manifest(manifest_path, manifest)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Exported {rows_total} rows in {elapsed:.1f}s to {output} '
+                f'({rows_total / elapsed if elapsed else 0:,.0f} rows/sec)'
+            )
+        )
+
+    def _load_manifest(self, path, params, params_hash, resume):
+        if path.exists():
+            with open(path) as f:
+                manifest = json.load(f)
+            if not resume:
+                raise CommandError(
+                    f'{path} already exists; pass --resume to continue that export '
+                    f'or choose an empty --output directory'
+                )
+            if manifest.get('params_hash') != params_hash:
+                raise CommandError(
+                    'Cannot resume: the existing manifest was written with different '
+                    'range, filter, mode or format options'
+                )
+            return manifest
+        return {
+            'params': params,
+            'params_hash': params_hash,
+            'created_at': timezone.now().isoformat(),
+            'completed': {},
+        }
+
+    def _save_manifest(self, path, manifest):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
@@ -0,0 +1,320 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+from concurrent.futures import FIRST_COMPLETED, wait
+from collections import Counter
+import csv
+import gzip
+import io
+import multiprocessing
+import os
+import queue
+import time
+import uuid
+
+from energy.completeness import record_measures
+from energy.models import GridNode, Measures, MeasuresImport
+from energy.parallel import process_pool
+
+MAX_ABS_VALUE = Decimal('999999999.999')
+
+
+def build_node_lookup():
+    """Map (grid name, region name, node name) to node ids in a single query"""
+    return {
+        (grid_name, region_name, node_name): str(node_id)
+        for node_id, node_name, region_name, grid_name in GridNode.objects.values_list(
+            'id', 'name', 'region__name', 'region__grid__name'
+        )
+    }
+
+
+def file_format(path):
+    if path.endswith('.parquet'):
+        return 'parquet'
+    if path.endswith('.csv') or path.endswith('.csv.gz'):
+        return 'csv'
+    raise CommandError(f'Unsupported file type: {path} (expected .csv, .csv.gz or .parquet)')
+
+
+def read_rows(path, batch_size):
+    """Yield the rows of a CSV or Parquet file as dicts"""
+    if file_format(path) == 'parquet':
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            yield from batch.to_pylist()
+    else:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8', newline='') as f:
+            yield from csv.DictReader(f)
+
+
+def parse_timestamp(value):
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = parse_datetime(str(value).strip())
+        if parsed is None:
+            raise ValueError
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def parse_row(row, lookup, node_ids):
+    """
+    Turn one input row into (node_id, timestamp, collected_at, value).
+    Raises ValueError with the reject reason for invalid rows.
+    """
+    node_id = row.get('node_id')
+    if node_id:
+        try:
+            node_id = str(uuid.UUID(str(node_id)))
+        except ValueError:
+            raise ValueError('unknown node')
+        if node_id not in node_ids:
+            raise ValueError('unknown node')
+    else:
+        node_id = lookup.get((row.get('grid'), row.get('region'), row.get('node')))
+        if node_id is None:
+            raise ValueError('unknown node')
+
+    try:
+        timestamp = parse_timestamp(row['timestamp'])
+        collected_at = parse_timestamp(row['collected_at'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('invalid datetime')
+
+    try:
+        value = Decimal(str(row['value']).strip())
+    except (KeyError, InvalidOperation):
+        raise ValueError('invalid value')
+    if not value.is_finite() or abs(value) > MAX_ABS_VALUE:
+        raise ValueError('invalid value')
+
+    return node_id, timestamp, collected_at, value
+
+
+def import_file(path, lookup, batch_size, progress=None):
+    """
+    Load one file through an unlogged staging table and merge it into
+    measures. Runs inside a worker process; after every COPY batch
+    (path, rows read, rows staged) is put on the `progress` queue.
+    """
+    started = time.monotonic()
+    node_ids = set(lookup.values())
+    quote = connection.ops.quote_name
+    measures_table = quote(Measures._meta.db_table)
+    staging_table = quote(f'measures_import_{uuid.uuid4().hex}')
+
+    rows_read = 0
+    rows_staged = 0
+    rejects = Counter()
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE UNLOGGED TABLE {staging_table} ('
+            f'line bigint NOT NULL, id uuid NOT NULL, node_id uuid NOT NULL, '
+            f'"timestamp" timestamptz NOT NULL, collected_at timestamptz NOT NULL, '
+            f'value numeric(15, 3) NOT NULL)'
+        )
+        try:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            buffered = 0
+
+            def flush():
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f'COPY {staging_table} (line, id, node_id, "timestamp", collected_at, value) '
+                    f'FROM STDIN WITH (FORMAT csv)',
+                    buffer
+                )
+                buffer.seek(0)
+                buffer.truncate()
+
+            for rows_read, row in enumerate(read_rows(path, batch_size), start=1):
+                try:
+                    node_id, timestamp, collected_at, value = parse_row(row, lookup, node_ids)
+                except ValueError as exc:
+                    rejects[str(exc)] += 1
+                    continue
+                writer.writerow([
+                    rows_read, uuid.uuid4(), node_id,
+                    timestamp.isoformat(), collected_at.isoformat(), value
+                ])
+                buffered += 1
+                if buffered >= batch_size:
+                    flush()
+                    rows_staged += buffered
+                    buffered = 0
+                    if progress is not None:
+                        progress.put((path, rows_read, rows_staged))
+            if buffered:
+                flush()
+                rows_staged += buffered
+
+            # Later lines win when a file repeats the same (node, timestamp, collected_at)
+            with transaction.atomic():
+                cursor.execute(
+                    f'INSERT INTO {measures_table} (id, node_id, "timestamp", collected_at, value) '
+                    f'SELECT DISTINCT ON (node_id, "timestamp", collected_at) '
+                    f'id, node_id, "timestamp", collected_at, value FROM {staging_table} '
+                    f'ORDER BY node_id, "timestamp", collected_at, line DESC '
+                    f'ON CONFLICT (node_id, "timestamp", collected_at) '
+                    f'DO UPDATE SET value = EXCLUDED.value'
+                )
+                rows_merged = cursor.rowcount
+
+                # The merge bypasses the ORM signals, so update the completeness index here.
+                # Sorted so that concurrent imports lock the completeness rows in the same order.
+                cursor.execute(
+                    f'SELECT node_id, date_trunc(%s, "timestamp"), max(collected_at) '
+                    f'FROM {staging_table} GROUP BY 1, 2 ORDER BY 1, 2',
+                    ['hour']
+                )
+                while True:
+                    hours = cursor.fetchmany(batch_size)
+                    if not hours:
+                        break
+                    record_measures(hours)
+
+                # Tells hot window stores in other processes to reload the merged range
+                if rows_merged:
+                    cursor.execute(f'SELECT min("timestamp"), max("timestamp") FROM {staging_table}')
+                    first_timestamp, last_timestamp = cursor.fetchone()
+                    MeasuresImport.objects.create(
+                        rows=rows_merged,
+                        first_timestamp=first_timestamp,
+                        last_timestamp=last_timestamp,
+                    )
+        finally:
+            cursor.execute(f'DROP TABLE IF EXISTS {staging_table}')
+
+    return {
+        'path': path,
+        'rows_read': rows_read,
+        'rows_staged': rows_staged,
+        'rows_merged': rows_merged,
+        'rejects': dict(rejects),
+        'elapsed': time.monotonic() - started,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Bulk import measures from CSV or Parquet files via a staging table merge'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'files',
+            nargs='+',
+            help='CSV (.csv, .csv.gz) or Parquet files with timestamp, collected_at, value '
+                 'and either node_id or grid, region and node name columns'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=min(4, os.cpu_count() or 1),
+            help='Number of files loaded in parallel (default: min(4, CPU count))'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50000,
+            help='Rows sent per COPY batch (default: 50000)'
+        )
+
+    def handle(self, *args, **options):
+        files = options['files']
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers and --batch-size must be positive')
+        if connection.vendor != 'postgresql':
+            raise CommandError('import_measures requires PostgreSQL')
+        for path in files:
+            if not os.path.isfile(path):
+                raise CommandError(f'File not found: {path}')
+            if file_format(path) == 'parquet':
+                try:
+                    import pyarrow  # noqa: F401
+                except ImportError:
+                    raise CommandError('Parquet import requires pyarrow (pip install pyarrow)')
+
+        lookup = build_node_lookup()
+        self.stdout.write(
+            f'Importing {len(files)} file(s) with {options["workers"]} worker(s) '
+            f'({len(lookup)} known nodes)'
+        )
+
+        started = time.monotonic()
+        totals = Counter()
+        rejects = Counter()
+        failed = []
+        # Rows staged so far by the files still being loaded, for progress reports
+        in_progress = {}
+
+        def report_progress():
+            while True:
+                try:
+                    path, rows_read, rows_staged = progress.get_nowait()
+                except queue.Empty:
+                    return
+                in_progress[path] = rows_staged
+                staged = totals['rows_staged'] + sum(in_progress.values())
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'  {path}: {rows_staged} rows staged of {rows_read} read '
+                    f'(total {staged} rows, {staged / elapsed if elapsed else 0:,.0f} rows/sec)'
+                )
+
+        with process_pool(options['workers']) as pool, multiprocessing.Manager() as manager:
+            progress = manager.Queue()
+            futures = {
+                pool.submit(import_file, path, lookup, options['batch_size'], progress): path
+                for path in files
+            }
+            pending = set(futures)
+            done = 0
+            while pending:
+                finished, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+                report_progress()
+                for future in finished:
+                    done += 1
+                    path = futures[future]
+                    in_progress.pop(path, None)
+                    try:
+                        result = future.result()
+                    except Exception as exc:
+                        failed.append(path)
+                        self.stderr.write(f'[{done}/{len(files)}] {path}: failed: {exc}')
+                        continue
+
+                    file_rejects = sum(result['rejects'].values())
+                    totals.update(
+                        rows_read=result['rows_read'],
+                        rows_staged=result['rows_staged'],
+                        rows_merged=result['rows_merged'],
+                    )
+                    rejects.update(result['rejects'])
+                    staged = totals['rows_staged'] + sum(in_progress.values())
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(
+                        f'[{done}/{len(files)}] {path}: {result["rows_staged"]} rows loaded, '
+                        f'{file_rejects} rejected in {result["elapsed"]:.1f}s '
+                        f'(total {staged} rows, {staged / elapsed if elapsed else 0:,.0f} rows/sec)'
+                    )
+
+        elapsed = time.monotonic() - started
+        summary = (
+            f'Read {totals["rows_read"]} rows, merged {totals["rows_merged"]} into measures, '
+            f'rejected {sum(rejects.values())} in {elapsed:.1f}s '
+            f'({totals["rows_staged"] / elapsed if elapsed else 0:,.0f} rows/sec)'
+        )
+        for reason, count in sorted(rejects.items()):
+            self.stdout.write(f'- {reason}: {count} rejected')
+        if failed:
+            raise CommandError(f'{summary}; {len(failed)} file(s) failed: {", ".join(failed)}')
+        self.stdout.write(self.style.SUCCESS(summary))
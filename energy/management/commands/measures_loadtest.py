@@ -0,0 +1,210 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.urls import resolve, reverse
+from datetime import timedelta
+import multiprocessing
+import statistics
+import threading
+import time
+
+from energy import singleflight
+from energy.management.commands.export_measures import parse_aware_datetime
+from energy.models import Measures
+from energy.parallel import process_pool
+
+
+class QueryCounter:
+    """connection.execute_wrapper that counts the statements of one client"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def mode_settings(backend):
+    """Settings of one mode; the hot window would answer without the database in both"""
+    return override_settings(MEASURES_SINGLE_FLIGHT_BACKEND=backend, MEASURES_HOT_WINDOW_DAYS=0)
+
+
+def run_client(params, bursts, barrier):
+    """
+    Send `bursts` requests, each released together with the other clients by
+    `barrier`, and return their latencies, failed status codes and query count
+    """
+    view = resolve(reverse('measures-query')).func
+    factory = RequestFactory()
+    counter = QueryCounter()
+    latencies = []
+    errors = []
+    try:
+        with connection.execute_wrapper(counter):
+            for _ in range(bursts):
+                barrier.wait()
+                started = time.perf_counter()
+                response = view(factory.get('/', params))
+                response.render()
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+    except BaseException:
+        # Release the other clients instead of leaving them waiting forever
+        barrier.abort()
+        raise
+    finally:
+        connection.close()
+    return {'latencies': latencies, 'errors': errors, 'queries': counter.count}
+
+
+def run_process_client(backend, params, bursts, barrier):
+    """run_client in a worker process, which also reports its single-flight metrics"""
+    with mode_settings(backend):
+        result = run_client(params, bursts, barrier)
+        result['metrics'] = singleflight.get_metrics()
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire bursts of identical concurrent /measures/query/ requests and compare the '
+        'database queries they run with and without single-flight coalescing'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=32,
+            help='Identical requests fired at once per burst (default: 32)'
+        )
+        parser.add_argument(
+            '--bursts',
+            type=int,
+            default=5,
+            help='Number of bursts per mode (default: 5)'
+        )
+        parser.add_argument(
+            '--start',
+            type=parse_aware_datetime,
+            help='Range start (default: 24 hours before the newest measure)'
+        )
+        parser.add_argument(
+            '--end',
+            type=parse_aware_datetime,
+            help='Range end (default: the newest measure)'
+        )
+        parser.add_argument('--node-id', help='Query this node only')
+        parser.add_argument('--region-id', help='Query this region only')
+        parser.add_argument('--grid-id', help='Query this grid only')
+        parser.add_argument(
+            '--backend',
+            choices=['thread', 'file'],
+            default='thread',
+            help='Single-flight backend to compare against no coalescing (default: thread)'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=60,
+            help='Seconds to wait for all clients to be ready for a burst before failing (default: 60)'
+        )
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['bursts'] < 1:
+            raise CommandError('--concurrency and --bursts must be positive')
+
+        end = options['end']
+        if end is None:
+            end = Measures.objects.aggregate(last=Max('timestamp'))['last']
+            if end is None:
+                raise CommandError('No measures found; seed data or pass --start and --end')
+        start = options['start'] or end - timedelta(hours=24)
+
+        params = {'start_datetime': start.isoformat(), 'end_datetime': end.isoformat()}
+        for name in ('node_id', 'region_id', 'grid_id'):
+            if options[name]:
+                params[name] = options[name]
+        connection.close()
+
+        # The file backend coalesces across processes, so its clients are processes
+        processes = options['backend'] == 'file'
+        self.stdout.write(
+            f"{options['bursts']} bursts of {options['concurrency']} identical requests "
+            f"from {'processes' if processes else 'threads'} "
+            f'for {start.isoformat()} to {end.isoformat()}'
+        )
+        baseline = self.run_mode('none', params, options, processes)
+        coalesced = self.run_mode(options['backend'], params, options, processes)
+
+        if baseline['queries']:
+            reduction = 100 * (1 - coalesced['queries'] / baseline['queries'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Database queries reduced by {reduction:.1f}% "
+                f"({baseline['queries']} -> {coalesced['queries']})"
+            ))
+
+    def run_mode(self, backend, params, options, processes):
+        """Run all bursts with one backend and report queries, latency and coalescing"""
+        concurrency = options['concurrency']
+        singleflight.reset_metrics()
+        started = time.perf_counter()
+        if processes:
+            with process_pool(concurrency) as pool, multiprocessing.Manager() as manager:
+                barrier = manager.Barrier(concurrency, timeout=options['timeout'])
+                futures = [
+                    pool.submit(run_process_client, backend, params, options['bursts'], barrier)
+                    for _ in range(concurrency)
+                ]
+                clients, failures = [], []
+                for future in futures:
+                    try:
+                        clients.append(future.result())
+                    except Exception as exc:
+                        failures.append(exc)
+            metrics = {
+                name: sum(client['metrics'][name] for client in clients)
+                for name in singleflight.METRICS
+            }
+        else:
+            barrier = threading.Barrier(concurrency, timeout=options['timeout'])
+            clients, failures = [], []
+
+            def client():
+                try:
+                    clients.append(run_client(params, options['bursts'], barrier))
+                except Exception as exc:
+                    failures.append(exc)
+
+            with mode_settings(backend):
+                threads = [threading.Thread(target=client) for _ in range(concurrency)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                metrics = singleflight.get_metrics()
+        elapsed = time.perf_counter() - started
+
+        # Report the failure that broke the barrier rather than the clients it released
+        failures.sort(key=lambda exc: isinstance(exc, threading.BrokenBarrierError))
+        if failures:
+            raise CommandError(f'{len(failures)} client(s) failed: {failures[0]!r}')
+        errors = [status for client in clients for status in client['errors']]
+        if errors:
+            raise CommandError(f'{len(errors)} request(s) failed with status {errors[0]}')
+
+        latencies = sorted(latency for client in clients for latency in client['latencies'])
+        queries = sum(client['queries'] for client in clients)
+        requests = len(latencies)
+        self.stdout.write(
+            f'{backend:>6}: {requests} requests in {elapsed:.2f}s, '
+            f'{queries} DB queries ({queries / requests:.2f}/request), '
+            f"{metrics['executed']} executed, {metrics['coalesced']} coalesced, "
+            f'latency p50 {statistics.median(latencies) * 1000:.0f} ms '
+            f'max {latencies[-1] * 1000:.0f} ms'
+        )
+        return {'queries': queries, 'elapsed': elapsed}
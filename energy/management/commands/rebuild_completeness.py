@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils.dateparse import parse_date
+from datetime import timedelta, timezone as dt_timezone
+
+from energy.completeness import rebuild_completeness
+from energy.models import GridNode, Measures
+
+
+def parse_day(value):
+    """argparse type for ISO dates"""
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(f'Invalid date: {value}')
+    return parsed
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per node and day completeness index from the measures table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            type=parse_day,
+            help='First day to rebuild (default: first day with measures)'
+        )
+        parser.add_argument(
+            '--end',
+            type=parse_day,
+            help='Last day to rebuild, inclusive (default: last day with measures)'
+        )
+        parser.add_argument('--node-id', help='Only rebuild this node')
+        parser.add_argument('--region-id', help='Only rebuild nodes of this region')
+        parser.add_argument('--grid-id', help='Only rebuild nodes of this grid')
+        parser.add_argument(
+            '--days-per-batch',
+            type=int,
+            default=31,
+            help='Days recomputed per node and transaction (default: 31)'
+        )
+
+    def handle(self, *args, **options):
+        nodes = GridNode.objects.all()
+        if options['node_id']:
+            nodes = nodes.filter(id=options['node_id'])
+        if options['grid_id']:
+            nodes = nodes.filter(region__grid_id=options['grid_id'])
+        if options['region_id']:
+            nodes = nodes.filter(region_id=options['region_id'])
+        node_ids = list(nodes.order_by('id').values_list('id', flat=True))
+        if not node_ids:
+            raise CommandError('No nodes match the given filters')
+        if options['days_per_batch'] < 1:
+            raise CommandError('--days-per-batch must be positive')
+
+        start = options['start']
+        end = options['end']
+        if start is None or end is None:
+            bounds = Measures.objects.filter(node_id__in=node_ids).aggregate(
+                first=Min('timestamp'), last=Max('timestamp')
+            )
+            if bounds['first'] is None:
+                self.stdout.write('No measures found, nothing to rebuild')
+                return
+            start = start or bounds['first'].astimezone(dt_timezone.utc).date()
+            end = end or bounds['last'].astimezone(dt_timezone.utc).date()
+        if start > end:
+            raise CommandError('--start must be before --end')
+
+        step = timedelta(days=options['days_per_batch'])
+        rows = 0
+        for index, node_id in enumerate(node_ids, start=1):
+            batch_start = start
+            while batch_start <= end:
+                batch_end = min(batch_start + step - timedelta(days=1), end)
+                rows += rebuild_completeness([node_id], batch_start, batch_end)
+                batch_start = batch_end + timedelta(days=1)
+            self.stdout.write(f'Rebuilt node {index}/{len(node_ids)} ({node_id})')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Rebuilt {rows} node-day rows for {len(node_ids)} node(s) from {start} to {end}'
+            )
+        )
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:43
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('energy', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeasuresQueryJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], db_index=True, default='pending', max_length=20)),
+                ('params', models.JSONField()),
+                ('format', models.CharField(choices=[('json', 'JSON'), ('csv', 'CSV (gzip)'), ('parquet', 'Parquet')], default='json', max_length=10)),
+                ('chunks_total', models.PositiveIntegerField(default=0)),
+                ('chunks_done', models.PositiveIntegerField(default=0)),
+                ('rows', models.PositiveBigIntegerField(default=0)),
+                ('result_path', models.CharField(blank=True, max_length=500)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Measures Query Job',
+                'verbose_name_plural': 'Measures Query Jobs',
+                'db_table': 'measures_query_jobs',
+            },
+        ),
+    ]
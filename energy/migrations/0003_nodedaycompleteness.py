@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:44
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('energy', '0002_measuresqueryjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NodeDayCompleteness',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('hour_mask', models.IntegerField(default=0)),
+                ('last_collected', models.JSONField(default=list)),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completeness', to='energy.gridnode')),
+            ],
+            options={
+                'verbose_name': 'Node Day Completeness',
+                'verbose_name_plural': 'Node Day Completeness',
+                'db_table': 'node_day_completeness',
+                'indexes': [models.Index(fields=['day'], name='node_day_co_day_58c9f2_idx')],
+                'unique_together': {('node', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('energy', '0003_nodedaycompleteness'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='measuresqueryjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('energy', '0004_measuresqueryjob_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeasuresImport',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('imported_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('rows', models.PositiveBigIntegerField()),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Measures Import',
+                'verbose_name_plural': 'Measures Imports',
+                'db_table': 'measures_imports',
+            },
+        ),
+    ]
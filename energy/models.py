@@ -1,7 +1,17 @@
-from django.db import models
+from django.db import models, router
+from django.db.models.functions import TruncDate
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.dispatch import Signal
+from django.utils import timezone
+from datetime import timezone as dt_timezone
 import uuid
 
+# Sent after Measures rows are deleted through the ORM, with `node_days`, the
+# (node_id, UTC day) pairs they were in, and `using`. Receivers update the
+# derived data (see energy/signals.py). Node cascades do not send it: they
+# use Django's fast delete and the derived rows go with the node.
+measures_deleted = Signal()
+
 
 class Grid(models.Model):
     """
@@ -55,6 +65,48 @@ class GridNode(models.Model):
         return f"{self.region.grid.name} - {self.region.name} - {self.name}"
 
 
+class MeasuresQuerySet(models.QuerySet):
+    """QuerySet helpers shared by the API views and the bulk commands"""
+
+    def for_hierarchy(self, node_id=None, region_id=None, grid_id=None):
+        """Restrict to a node, region and/or grid"""
+        queryset = self
+        if node_id:
+            queryset = queryset.filter(node_id=node_id)
+        if grid_id:
+            queryset = queryset.filter(node__region__grid_id=grid_id)
+        if region_id:
+            queryset = queryset.filter(node__region_id=region_id)
+        return queryset
+
+    def latest_revisions(self, collected_before=None):
+        """
+        Keep only the newest revision of every (node, timestamp) pair,
+        optionally ignoring revisions collected after `collected_before`.
+        Uses DISTINCT ON, so it is PostgreSQL only and walks the
+        (node, timestamp, collected_at) index.
+        """
+        queryset = self
+        if collected_before is not None:
+            queryset = queryset.filter(collected_at__lte=collected_before)
+        return queryset.order_by(
+            'node_id', 'timestamp', '-collected_at'
+        ).distinct('node_id', 'timestamp')
+
+    def delete(self):
+        """Delete, then send measures_deleted once for all the node-days the rows were in"""
+        node_days = list(self.order_by().annotate(
+            day=TruncDate('timestamp', tzinfo=dt_timezone.utc)
+        ).values_list('node_id', 'day').distinct())
+        deleted = super().delete()
+        if node_days:
+            measures_deleted.send(sender=self.model, node_days=node_days, using=self.db)
+        return deleted
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class Measures(models.Model):
     """
     Measures model for storing hourly time series values with evolution support.
@@ -77,6 +129,8 @@ class Measures(models.Model):
         validators=[MinValueValidator(-999999999.999), MaxValueValidator(999999999.999)]
     )
 
+    objects = MeasuresQuerySet.as_manager()
+
     class Meta:
         db_table = 'measures'
         verbose_name = 'Measure'
@@ -93,6 +147,20 @@ class Measures(models.Model):
     def __str__(self):
         return f"{self.node} - {self.timestamp} - {self.value}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Where the row was loaded from, so the signal handlers can tell when a save moves it
+        instance._loaded_slot = (instance.__dict__.get('node_id'), instance.__dict__.get('timestamp'))
+        return instance
+
+    def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(self.__class__, instance=self)
+        deleted = super().delete(using=using, keep_parents=keep_parents)
+        node_day = (self.node_id, self.timestamp.astimezone(dt_timezone.utc).date())
+        measures_deleted.send(sender=Measures, node_days=[node_day], using=using)
+        return deleted
+
     @property
     def grid_name(self):
         return self.node.region.grid.name
@@ -104,3 +172,115 @@ class Measures(models.Model):
     @property
     def node_name(self):
         return self.node.name
+
+
+class NodeDayCompleteness(models.Model):
+    """
+    Per node and UTC day summary of which hours have measures and when each
+    hour was last collected. Maintained by energy.completeness on every
+    Measures write so gaps can be found without scanning the measures table.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    node = models.ForeignKey(GridNode, on_delete=models.CASCADE, related_name='completeness')
+    day = models.DateField()
+
+    # Bit h is set when hour h (UTC) of the day has at least one measure
+    hour_mask = models.IntegerField(default=0)
+
+    # 24 entries: latest collected_at (ISO format) per hour, or null
+    last_collected = models.JSONField(default=list)
+
+    class Meta:
+        db_table = 'node_day_completeness'
+        verbose_name = 'Node Day Completeness'
+        verbose_name_plural = 'Node Day Completeness'
+        unique_together = ['node', 'day']
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+    def __str__(self):
+        return f"{self.node} - {self.day} - {bin(self.hour_mask).count('1')}/24"
+
+
+class MeasuresImport(models.Model):
+    """
+    One row per import_measures merge, written in the merge's transaction.
+    The merge sends no signals, so hot window stores poll this table to
+    notice rows they have not seen (see energy/hotwindow.py).
+    """
+    # Increasing id; stores remember the newest one they have handled
+    id = models.BigAutoField(primary_key=True)
+    imported_at = models.DateTimeField(default=timezone.now)
+    rows = models.PositiveBigIntegerField()
+
+    # Range of the merged timestamps
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+
+    class Meta:
+        db_table = 'measures_imports'
+        verbose_name = 'Measures Import'
+        verbose_name_plural = 'Measures Imports'
+
+    def __str__(self):
+        return f"{self.imported_at} - {self.rows} rows"
+
+
+class MeasuresQueryJob(models.Model):
+    """
+    Background execution of a measures query. The result is written to a
+    file under settings.MEASURES_JOBS_DIR and removed once the job expires.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    ACTIVE_STATUSES = [STATUS_PENDING, STATUS_RUNNING]
+
+    FORMAT_CHOICES = [
+        ('json', 'JSON'),
+        ('csv', 'CSV (gzip)'),
+        ('parquet', 'Parquet'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    # Query parameters as accepted by MeasuresQuerySerializer
+    params = models.JSONField()
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='json')
+
+    chunks_total = models.PositiveIntegerField(default=0)
+    chunks_done = models.PositiveIntegerField(default=0)
+    rows = models.PositiveBigIntegerField(default=0)
+    result_path = models.CharField(max_length=500, blank=True)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Refreshed by the process that owns the job (see energy/jobs.py)
+    heartbeat_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'measures_query_jobs'
+        verbose_name = 'Measures Query Job'
+        verbose_name_plural = 'Measures Query Jobs'
+
+    def __str__(self):
+        return f"{self.id} - {self.status}"
+
+    @property
+    def progress(self):
+        if self.status == self.STATUS_SUCCEEDED:
+            return 1.0
+        if not self.chunks_total:
+            return 0.0
+        return self.chunks_done / self.chunks_total
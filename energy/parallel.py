@@ -0,0 +1,24 @@
+"""
+Helpers for running ORM work in a process pool from management commands.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import connections
+
+
+def _init_worker():
+    """Make sure Django is configured in a freshly started worker process"""
+    django.setup()
+
+
+def process_pool(workers):
+    """
+    Create a process pool whose workers can use the ORM.
+
+    Database connections are closed first so that forked workers never
+    share a socket with the parent; each worker opens its own connection
+    on first use.
+    """
+    connections.close_all()
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
@@ -1,5 +1,9 @@
 from rest_framework import serializers
-from .models import Grid, GridRegion, GridNode, Measures
+from datetime import timedelta
+
+from .models import Grid, GridRegion, GridNode, Measures, MeasuresQueryJob
+
+MAX_GAPS_RANGE_DAYS = 366
 
 
 class GridSerializer(serializers.ModelSerializer):
@@ -38,15 +42,71 @@ class MeasuresSerializer(serializers.ModelSerializer):
         ]
 
 
-class MeasuresQuerySerializer(serializers.Serializer):
-    """Serializer for querying measures with date range filters"""
+class MeasuresRangeQuerySerializer(serializers.Serializer):
+    """Date range and node hierarchy filters shared by the measures query serializers"""
     start_datetime = serializers.DateTimeField(required=True)
     end_datetime = serializers.DateTimeField(required=True)
-    collected_datetime = serializers.DateTimeField(required=False)
     node_id = serializers.UUIDField(required=False)
     grid_id = serializers.UUIDField(required=False)
     region_id = serializers.UUIDField(required=False)
 
+    def validate(self, attrs):
+        if attrs['start_datetime'] > attrs['end_datetime']:
+            raise serializers.ValidationError('start_datetime must be before end_datetime')
+        return attrs
+
+
+class MeasuresQuerySerializer(MeasuresRangeQuerySerializer):
+    """Serializer for querying measures with date range filters"""
+    collected_datetime = serializers.DateTimeField(required=False)
+
+
+class MeasuresGapsQuerySerializer(MeasuresRangeQuerySerializer):
+    """Serializer for missing/stale hour queries"""
+    stale_before = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if attrs['end_datetime'] - attrs['start_datetime'] > timedelta(days=MAX_GAPS_RANGE_DAYS):
+            raise serializers.ValidationError(
+                f'The date range must not exceed {MAX_GAPS_RANGE_DAYS} days'
+            )
+        return attrs
+
+
+class MeasuresJobCreateSerializer(MeasuresQuerySerializer):
+    """Serializer for submitting a measures query as a background job"""
+    format = serializers.ChoiceField(choices=MeasuresQueryJob.FORMAT_CHOICES, default='json')
+
+
+class MeasuresQueryJobSerializer(serializers.ModelSerializer):
+    """Serializer for background job status"""
+    progress = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = MeasuresQueryJob
+        fields = [
+            'id', 'status', 'format', 'params', 'progress', 'chunks_done', 'chunks_total',
+            'rows', 'error', 'created_at', 'started_at', 'finished_at', 'expires_at'
+        ]
+
+
+class MeasuresLeadTimeQuerySerializer(MeasuresRangeQuerySerializer):
+    """Serializer for fixed lead-time queries ("value known N hours before" or "as of 09:00 the day before")"""
+    lead = serializers.DurationField(required=False)
+    cutoff_time = serializers.TimeField(required=False)
+    cutoff_days_before = serializers.IntegerField(required=False, default=1, min_value=0)
+
+    def validate_lead(self, value):
+        if value.total_seconds() < 0:
+            raise serializers.ValidationError('lead must not be negative')
+        return value
+
+    def validate(self, attrs):
+        if ('lead' in attrs) == ('cutoff_time' in attrs):
+            raise serializers.ValidationError('Provide exactly one of lead or cutoff_time')
+        return super().validate(attrs)
+
 
 class MeasuresResponseSerializer(serializers.ModelSerializer):
     """Serializer for measures API response with additional context"""
@@ -0,0 +1,81 @@
+"""
+Signal handlers that keep derived measures data in sync with ORM writes.
+Bulk writes that bypass the ORM (import_measures) update it themselves.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .completeness import hour_slot, rebuild_completeness, record_measures
+from .hotwindow import loaded_store
+from .models import Grid, GridRegion, GridNode, Measures, measures_deleted
+
+
+@receiver(pre_save, sender=Measures)
+def remember_measure_slot(sender, instance, raw=False, **kwargs):
+    """Remember where an updated measure used to be, in case it moves"""
+    if raw or instance._state.adding:
+        return
+    previous = getattr(instance, '_loaded_slot', None)
+    if previous is None or None in previous:
+        # Loaded without its node or timestamp (e.g. deferred), read them
+        previous = Measures.objects.filter(pk=instance.pk).values_list(
+            'node_id', 'timestamp'
+        ).first()
+    instance._previous_slot = previous
+
+
+@receiver(post_save, sender=Measures)
+def update_completeness_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    record_measures([(instance.node_id, instance.timestamp, instance.collected_at)])
+
+    previous = getattr(instance, '_previous_slot', None)
+    if previous and previous != (instance.node_id, instance.timestamp):
+        day = hour_slot(previous[1])[0]
+        rebuild_completeness([previous[0]], day, day)
+
+
+@receiver(post_save, sender=Measures)
+def update_hot_window_on_save(sender, instance, raw=False, **kwargs):
+    store = loaded_store()
+    previous = getattr(instance, '_previous_slot', None)
+    instance._previous_slot = None
+    instance._loaded_slot = (instance.node_id, instance.timestamp)
+    if raw or store is None:
+        return
+    transaction.on_commit(lambda: store.record(instance))
+
+    if previous and previous != (instance.node_id, instance.timestamp):
+        day = hour_slot(previous[1])[0]
+        transaction.on_commit(lambda: store.reload_days([(previous[0], day)]))
+
+
+@receiver(measures_deleted, sender=Measures)
+def update_on_delete(sender, node_days, using, **kwargs):
+    """Rebuild each node-day the deleted rows were in once the deletion commits"""
+    def rebuild():
+        days = defaultdict(set)
+        for node_id, day in node_days:
+            days[day].add(node_id)
+        for day, node_ids in sorted(days.items()):
+            rebuild_completeness(node_ids, day, day)
+
+        store = loaded_store()
+        if store is not None:
+            store.reload_days(node_days)
+
+    transaction.on_commit(rebuild, using=using)
+
+
+@receiver([post_save, post_delete], sender=Grid)
+@receiver([post_save, post_delete], sender=GridRegion)
+@receiver([post_save, post_delete], sender=GridNode)
+def invalidate_hot_window(sender, **kwargs):
+    """Names or the node hierarchy changed, reload the store on next use"""
+    store = loaded_store()
+    if store is not None:
+        store.invalidate()
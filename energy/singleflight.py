@@ -0,0 +1,282 @@
+"""
+Single-flight coalescing of identical concurrent measures queries.
+
+While one request computes the response for a set of query parameters,
+identical requests arriving in the meantime wait for it and share its
+result instead of running the same query again. Results are only shared
+between requests that overlap in time; nothing is kept once a flight has
+landed, so this is not a cache.
+
+Backends (settings.MEASURES_SINGLE_FLIGHT_BACKEND):
+
+- thread: flights are tracked per process, so the threads of one worker
+  share a query
+- file: additionally serialises the processes of a host on one lock file
+  per key in MEASURES_SINGLE_FLIGHT_DIR. The process holding the lock runs
+  the query; processes that find the lock taken count themselves in a
+  waiters file next to it. When that count is not zero, the leader pickles
+  its result next to the lock file, the waiters read it instead of
+  querying and the last one deletes it. The directory must only be
+  writable by the application.
+
+Followers whose leader fails or takes longer than
+MEASURES_SINGLE_FLIGHT_TIMEOUT_SECONDS run the query themselves.
+"""
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOCK_POLL_SECONDS = 0.01
+# Lock, waiters and result files untouched for this long are removed by the next leader
+FILE_MAX_AGE_SECONDS = 3600
+
+METRICS = ('executed', 'coalesced', 'fallbacks')
+
+_metrics = dict.fromkeys(METRICS, 0)
+_metrics_lock = threading.Lock()
+
+
+def _count(name):
+    with _metrics_lock:
+        _metrics[name] += 1
+
+
+def get_metrics():
+    """
+    Counters of this process: queries executed, requests served from
+    another request's result (coalesced) and waits that ended in running the
+    query anyway after a timeout or a failed leader (fallbacks).
+    """
+    with _metrics_lock:
+        return dict(_metrics, backend=settings.MEASURES_SINGLE_FLIGHT_BACKEND)
+
+
+def reset_metrics():
+    with _metrics_lock:
+        _metrics.update(dict.fromkeys(METRICS, 0))
+
+
+def request_key(name, serializer):
+    """
+    Key of a request: the view name and the serialized form of its validated
+    query serializer, so equivalent spellings of the same parameters (e.g.
+    other UTC offsets or parameter order) share a flight.
+    """
+    params = json.dumps(serializer.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{name}:{params}'.encode()).hexdigest()
+
+
+class Flight:
+    """A computation in progress and the number of requests waiting for it"""
+
+    def __init__(self):
+        self.future = Future()
+        self.waiters = 0
+
+
+class ThreadBackend:
+    """Coalesces identical requests within the current process"""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.flights = {}
+
+    def run(self, key, compute):
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+            else:
+                flight.waiters += 1
+
+        if leader:
+            return self._lead(key, flight, compute)
+
+        try:
+            result = flight.future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            logger.warning('Timed out waiting for single-flight leader of %s', key)
+        except Exception:
+            # The leader's error is logged by the leader's request
+            pass
+        else:
+            _count('coalesced')
+            return result
+        _count('fallbacks')
+        return self.execute(key, compute)
+
+    def _lead(self, key, flight, compute):
+        try:
+            result = self.execute(key, compute)
+        except Exception as exc:
+            flight.future.set_exception(exc)
+            raise
+        except BaseException:
+            flight.future.set_exception(RuntimeError('Single-flight leader was interrupted'))
+            raise
+        else:
+            flight.future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.flights[key]
+
+    def execute(self, key, compute):
+        """Run the computation of a flight's leader"""
+        _count('executed')
+        return compute()
+
+
+class FileBackend(ThreadBackend):
+    """Also coalesces identical requests across the processes of a host"""
+
+    def __init__(self, timeout, directory):
+        if fcntl is None:
+            raise ImproperlyConfigured(
+                "MEASURES_SINGLE_FLIGHT_BACKEND='file' requires fcntl (POSIX systems only)"
+            )
+        super().__init__(timeout)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.last_prune = None
+
+    def _acquire(self, lock_file, timeout):
+        """Take the exclusive lock, giving up after `timeout` seconds"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(LOCK_POLL_SECONDS)
+
+    def _count_waiters(self, waiters_path, delta=0):
+        """Add `delta` to the number of processes waiting for a key's lock and return it"""
+        with open(waiters_path, 'a+') as waiters_file:
+            fcntl.flock(waiters_file, fcntl.LOCK_EX)
+            try:
+                waiters_file.seek(0)
+                waiters = max(int(waiters_file.read() or 0) + delta, 0)
+                if delta:
+                    waiters_file.truncate(0)
+                    waiters_file.write(str(waiters))
+                return waiters
+            finally:
+                waiters_file.flush()
+                fcntl.flock(waiters_file, fcntl.LOCK_UN)
+
+    def execute(self, key, compute):
+        """Run the computation of this process's leader under the key's file lock"""
+        arrived = time.time()
+        lock_path = self.directory / f'{key}.lock'
+        waiters_path = self.directory / f'{key}.waiters'
+        result_path = self.directory / f'{key}.pickle'
+
+        with open(lock_path, 'a') as lock_file:
+            waited = not self._acquire(lock_file, 0)
+            if waited:
+                self._count_waiters(waiters_path, 1)
+                acquired = self._acquire(lock_file, self.timeout)
+                waiters = self._count_waiters(waiters_path, -1)
+                if not acquired:
+                    logger.warning('Timed out waiting for single-flight lock %s', lock_path)
+                    _count('fallbacks')
+                    return super().execute(key, compute)
+            try:
+                if waited:
+                    try:
+                        with open(result_path, 'rb') as result_file:
+                            finished_at, result = pickle.load(result_file)
+                    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+                        finished_at = None
+                    if finished_at is not None and finished_at >= arrived:
+                        # Another process finished the query while this one was waiting
+                        if not waiters:
+                            result_path.unlink(missing_ok=True)
+                        _count('coalesced')
+                        return result
+
+                os.utime(lock_path)
+                result = super().execute(key, compute)
+                finished_at = time.time()
+                if self._count_waiters(waiters_path):
+                    tmp_path = result_path.with_name(f'{result_path.name}.{os.getpid()}.tmp')
+                    with open(tmp_path, 'wb') as result_file:
+                        pickle.dump((finished_at, result), result_file, pickle.HIGHEST_PROTOCOL)
+                    os.replace(tmp_path, result_path)
+                else:
+                    result_path.unlink(missing_ok=True)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        self.prune()
+        return result
+
+    def prune(self):
+        """Remove the files of keys that have not been queried for a while"""
+        now = time.monotonic()
+        if self.last_prune is not None and now - self.last_prune < FILE_MAX_AGE_SECONDS:
+            return
+        self.last_prune = now
+        cutoff = time.time() - FILE_MAX_AGE_SECONDS
+        for path in self.directory.iterdir():
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend():
+    """The process-wide backend for the current settings, or None when disabled"""
+    name = settings.MEASURES_SINGLE_FLIGHT_BACKEND
+    if name == 'none':
+        return None
+    timeout = settings.MEASURES_SINGLE_FLIGHT_TIMEOUT_SECONDS
+    directory = settings.MEASURES_SINGLE_FLIGHT_DIR
+    with _backends_lock:
+        backend = _backends.get((name, timeout, directory))
+        if backend is None:
+            if name == 'thread':
+                backend = ThreadBackend(timeout)
+            elif name == 'file':
+                backend = FileBackend(timeout, directory)
+            else:
+                raise ImproperlyConfigured(
+                    "MEASURES_SINGLE_FLIGHT_BACKEND must be 'thread', 'file' or 'none'"
+                )
+            _backends[(name, timeout, directory)] = backend
+        return backend
+
+
+def run(key, compute):
+    """Return compute(), sharing its result with identical concurrent calls for `key`"""
+    backend = get_backend()
+    if backend is None:
+        _count('executed')
+        return compute()
+    return backend.run(key, compute)
@@ -0,0 +1,104 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+
+from energy.models import Grid, GridRegion, GridNode, Measures
+
+
+class MeasuresAdminTests(TestCase):
+    """The Measures changelist must not scale its query count with the data"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        start = cls.start = timezone.now().replace(minute=0, second=0, microsecond=0)
+        for g in range(2):
+            grid = cls.grid = Grid.objects.create(name=f'Grid{g}')
+            for r in range(2):
+                region = GridRegion.objects.create(grid=grid, name=f'Region{r}')
+                for n in range(3):
+                    node = GridNode.objects.create(region=region, name=f'Node{n}')
+                    Measures.objects.bulk_create(
+                        Measures(
+                            node=node,
+                            timestamp=start + timedelta(hours=hour),
+                            collected_at=start,
+                            value=Decimal('1.000'),
+                        )
+                        for hour in range(10)
+                    )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        # PostgreSQL asks the planner for an estimate before falling back to
+        # an exact count on a table this small
+        self.count_queries = 2 if connection.vendor == 'postgresql' else 1
+
+    def test_changelist_query_count(self):
+        url = reverse('admin:energy_measures_changelist')
+        # session, user, result count, grid and region filter choices, results
+        with self.assertNumQueries(5 + self.count_queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Grid1 - Region1 - Node2')
+
+    def test_changelist_range_filters_query_count(self):
+        url = reverse('admin:energy_measures_changelist')
+        with self.assertNumQueries(5 + self.count_queries):
+            response = self.client.get(url, {
+                'timestamp_range': 'next_24h',
+                'collected_at_range': 'past_24h',
+            })
+        self.assertEqual(response.status_code, 200)
+
+    def test_changelist_explicit_range_filter(self):
+        url = reverse('admin:energy_measures_changelist')
+        start = self.start.astimezone(timezone.get_current_timezone()).replace(tzinfo=None)
+        with self.assertNumQueries(5 + self.count_queries):
+            response = self.client.get(url, {
+                'timestamp_from': (start + timedelta(hours=2)).isoformat(),
+                'timestamp_to': (start + timedelta(hours=5)).isoformat(),
+                'node__region__grid__id__exact': self.grid.id,
+            })
+        self.assertEqual(response.status_code, 200)
+        # Three hours of the grid's six nodes
+        self.assertEqual(len(response.context['cl'].result_list), 18)
+        # The form keeps the other filters
+        self.assertContains(
+            response, f'<input type="hidden" name="node__region__grid__id__exact" value="{self.grid.id}">',
+            html=True
+        )
+
+    def test_changelist_explicit_range_filter_defaults_missing_bound(self):
+        url = reverse('admin:energy_measures_changelist')
+        response = self.client.get(url, {'collected_at_from': '2000-01-01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['cl'].result_list), 0)
+
+    def test_changelist_explicit_range_filter_rejects_invalid_ranges(self):
+        url = reverse('admin:energy_measures_changelist')
+        for params in (
+            {'timestamp_from': 'yesterday'},
+            {'timestamp_from': '2024-02-30'},
+            {'timestamp_from': '2024-01-02', 'timestamp_to': '2024-01-01'},
+            {'timestamp_from': '2024-01-01', 'timestamp_to': '2024-03-01'},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get(url, params)
+                self.assertRedirects(response, f'{url}?e=1', fetch_redirect_response=False)
+
+    def test_node_autocomplete_query_count(self):
+        url = reverse('admin:autocomplete')
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {
+                'app_label': 'energy',
+                'model_name': 'measures',
+                'field_name': 'node',
+                'term': 'Node1',
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 4)
@@ -0,0 +1,144 @@
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TransactionTestCase, skipUnlessDBFeature
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+import csv
+import gzip
+import json
+import shutil
+import tempfile
+
+from energy.management.commands.export_measures import month_ranges
+from energy.models import Grid, GridRegion, GridNode, Measures
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+class MonthRangesTests(SimpleTestCase):
+    """month_ranges splits a range into calendar months"""
+
+    def test_ranges(self):
+        self.assertEqual(list(month_ranges(utc(2023, 11, 15, 6), utc(2024, 2, 1))), [
+            ('2023-11', utc(2023, 11, 15, 6), utc(2023, 12, 1), False),
+            ('2023-12', utc(2023, 12, 1), utc(2024, 1, 1), False),
+            ('2024-01', utc(2024, 1, 1), utc(2024, 2, 1), False),
+            # The end is inclusive, so a range ending on a month boundary has a one-instant last month
+            ('2024-02', utc(2024, 2, 1), utc(2024, 2, 1), True),
+        ])
+
+    def test_single_month(self):
+        self.assertEqual(list(month_ranges(utc(2024, 3, 2), utc(2024, 3, 20))), [
+            ('2024-03', utc(2024, 3, 2), utc(2024, 3, 20), True),
+        ])
+
+
+class ExportMeasuresCommandTests(TransactionTestCase):
+    """
+    End-to-end runs of export_measures. The latest and as-of modes use
+    DISTINCT ON and only run on PostgreSQL. A TransactionTestCase because
+    the worker processes only see committed rows.
+    """
+
+    def setUp(self):
+        grid = Grid.objects.create(name='Grid1')
+        region = GridRegion.objects.create(grid=grid, name='Region1')
+        self.node = GridNode.objects.create(region=region, name='Node1')
+        self.empty_node = GridNode.objects.create(region=region, name='Node2')
+        for hour in range(48):
+            for revision in range(2):
+                Measures.objects.create(
+                    node=self.node,
+                    timestamp=utc(2024, 1, 31) + timedelta(hours=hour),
+                    collected_at=utc(2024, 1, 30) + timedelta(hours=revision),
+                    value=Decimal(hour * 10 + revision),
+                )
+        self.output = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.output)
+
+    def export(self, *args, end='2024-03-31T23:00:00', mode='all', **options):
+        # Datetimes go through argparse so that they are parsed like on the command line
+        call_command(
+            'export_measures', '--start=2024-01-01T00:00:00', f'--end={end}', *args,
+            mode=mode, format='csv', output=str(self.output), workers=1, stdout=StringIO(),
+            **options
+        )
+        return json.loads((self.output / 'manifest.json').read_text())
+
+    def read_values(self, month):
+        with gzip.open(self.output / str(self.node.id) / f'{month}.csv.gz', 'rt') as f:
+            return [(row['timestamp'], row['value']) for row in csv.DictReader(f)]
+
+    def test_export(self):
+        manifest = self.export()
+
+        node_id = str(self.node.id)
+        self.assertEqual(manifest['completed'][f'{node_id}/2024-01'], {
+            'rows': 48, 'path': f'{node_id}/2024-01.csv.gz'
+        })
+        self.assertEqual(manifest['completed'][f'{node_id}/2024-02']['rows'], 48)
+        with gzip.open(self.output / node_id / '2024-02.csv.gz', 'rt') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 48)
+        self.assertEqual(rows[0]['value'], '240.000')
+
+        # Empty partitions are recorded without writing a file
+        self.assertEqual(manifest['completed'][f'{node_id}/2024-03'], {'rows': 0, 'path': None})
+        for month in ('2024-01', '2024-02', '2024-03'):
+            self.assertEqual(
+                manifest['completed'][f'{self.empty_node.id}/{month}'], {'rows': 0, 'path': None}
+            )
+        self.assertFalse((self.output / str(self.empty_node.id)).exists())
+        self.assertEqual(
+            sorted(path.name for path in (self.output / node_id).iterdir()),
+            ['2024-01.csv.gz', '2024-02.csv.gz']
+        )
+
+    def test_resume(self):
+        self.export()
+        with self.assertRaisesMessage(CommandError, 'pass --resume'):
+            self.export()
+
+        # Partitions recorded in the manifest are not exported again
+        (self.output / str(self.node.id) / '2024-01.csv.gz').unlink()
+        manifest = self.export(resume=True)
+        self.assertEqual(len(manifest['completed']), 6)
+        self.assertFalse((self.output / str(self.node.id) / '2024-01.csv.gz').exists())
+
+        # Partitions missing from the manifest (an interrupted run) are exported
+        del manifest['completed'][f'{self.node.id}/2024-01']
+        (self.output / 'manifest.json').write_text(json.dumps(manifest))
+        manifest = self.export(resume=True)
+        self.assertEqual(manifest['completed'][f'{self.node.id}/2024-01']['rows'], 48)
+        self.assertTrue((self.output / str(self.node.id) / '2024-01.csv.gz').exists())
+
+    def test_resume_with_different_parameters(self):
+        self.export()
+        with self.assertRaisesMessage(CommandError, 'different'):
+            self.export(resume=True, end='2024-04-30T23:00:00')
+        with self.assertRaisesMessage(CommandError, 'different'):
+            self.export(resume=True, node_id=str(self.node.id))
+
+    @skipUnlessDBFeature('can_distinct_on_fields')
+    def test_export_latest(self):
+        manifest = self.export(mode='latest')
+        self.assertEqual(manifest['completed'][f'{self.node.id}/2024-01']['rows'], 24)
+        values = self.read_values('2024-02')
+        self.assertEqual(len(values), 24)
+        # The newest revision of every timestamp, in timestamp order
+        self.assertEqual(values[0], ('2024-02-01T00:00:00+00:00', '241.000'))
+        self.assertEqual(values[-1], ('2024-02-01T23:00:00+00:00', '471.000'))
+
+    @skipUnlessDBFeature('can_distinct_on_fields')
+    def test_export_as_of(self):
+        manifest = self.export('--as-of=2024-01-30T00:30:00', mode='as-of')
+        self.assertEqual(manifest['completed'][f'{self.node.id}/2024-02']['rows'], 24)
+        # Only the first revision was collected by then
+        self.assertEqual(
+            [value for timestamp, value in self.read_values('2024-02')],
+            [f'{hour * 10}.000' for hour in range(24, 48)]
+        )
@@ -0,0 +1,128 @@
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.deletion import Collector
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+
+from energy.models import Grid, GridRegion, GridNode, Measures, NodeDayCompleteness
+
+
+class MeasuresGapsAPITests(TestCase):
+    """The completeness index follows Measures writes and answers gap queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        grid = Grid.objects.create(name='Grid1')
+        region = GridRegion.objects.create(grid=grid, name='Region1')
+        cls.node = GridNode.objects.create(region=region, name='Node1')
+        cls.empty_node = GridNode.objects.create(region=region, name='Node2')
+        cls.day = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        cls.early = cls.day - timedelta(days=1)
+        cls.late = cls.day + timedelta(hours=12)
+        # Hours 0-9 collected early, 10-19 late, 20-23 missing
+        for hour in range(20):
+            Measures.objects.create(
+                node=cls.node,
+                timestamp=cls.day + timedelta(hours=hour),
+                collected_at=cls.early if hour < 10 else cls.late,
+                value=Decimal(hour),
+            )
+
+    def get(self, **params):
+        params.setdefault('start_datetime', '2024-01-01T00:00:00Z')
+        params.setdefault('end_datetime', '2024-01-01T23:00:00Z')
+        response = self.client.get(reverse('measures-gaps'), params)
+        self.assertEqual(response.status_code, 200)
+        return {item['node_name']: item for item in response.json()['results']}
+
+    def test_missing_and_stale_hours(self):
+        results = self.get(stale_before=(self.day + timedelta(hours=1)).isoformat())
+        node = results['Node1']
+        self.assertEqual(node['missing_hours'], 4)
+        self.assertEqual(node['missing'], [{
+            'start': '2024-01-01T20:00:00Z', 'end': '2024-01-01T23:00:00Z', 'hours': 4
+        }])
+        self.assertEqual(node['stale_hours'], 10)
+        self.assertEqual(results['Node2']['missing_hours'], 24)
+
+    def test_does_not_read_measures(self):
+        url = reverse('measures-gaps')
+        # nodes, completeness rows
+        with self.assertNumQueries(2):
+            self.client.get(url, {
+                'start_datetime': '2023-10-01T00:00:00Z',
+                'end_datetime': '2024-01-01T23:00:00Z',
+            })
+
+    def test_updates_and_deletes_are_tracked(self):
+        Measures.objects.create(
+            node=self.node, timestamp=self.day + timedelta(hours=20),
+            collected_at=self.late, value=Decimal(1),
+        )
+        measure = Measures.objects.get(node=self.node, timestamp=self.day)
+        measure.timestamp = self.day + timedelta(hours=21)
+        # Loaded rows know their slot, so moving one does not read it again
+        with CaptureQueriesContext(connection) as queries:
+            measure.save()
+        self.assertFalse([
+            query for query in queries
+            if query['sql'].startswith('SELECT') and 'WHERE "measures"."id"' in query['sql']
+        ])
+        # Deletes are applied once the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            Measures.objects.get(node=self.node, timestamp=self.day + timedelta(hours=1)).delete()
+
+        missing = self.get()['Node1']['missing']
+        self.assertEqual(
+            [(run['start'], run['end']) for run in missing],
+            [
+                ('2024-01-01T00:00:00Z', '2024-01-01T01:00:00Z'),
+                ('2024-01-01T22:00:00Z', '2024-01-01T23:00:00Z'),
+            ]
+        )
+
+    def test_rebuild_matches_incremental_index(self):
+        incremental = {
+            row.day: (row.hour_mask, row.last_collected)
+            for row in NodeDayCompleteness.objects.filter(node=self.node)
+        }
+        NodeDayCompleteness.objects.all().delete()
+        call_command('rebuild_completeness', stdout=StringIO())
+        rebuilt = {
+            row.day: (row.hour_mask, row.last_collected)
+            for row in NodeDayCompleteness.objects.filter(node=self.node)
+        }
+        self.assertEqual(rebuilt, incremental)
+
+    def test_rejects_oversized_range(self):
+        response = self.client.get(reverse('measures-gaps'), {
+            'start_datetime': '2020-01-01T00:00:00Z',
+            'end_datetime': '2024-01-01T00:00:00Z',
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_deletes_rebuild_once_per_day(self):
+        def delete_queries(queryset):
+            with CaptureQueriesContext(connection) as queries:
+                with self.captureOnCommitCallbacks(execute=True):
+                    queryset.delete()
+            return len(queries)
+
+        few = delete_queries(Measures.objects.filter(node=self.node, timestamp__hour__gte=18))
+        many = delete_queries(Measures.objects.filter(node=self.node, timestamp__hour__lt=10))
+        self.assertEqual(many, few)
+        self.assertEqual(
+            NodeDayCompleteness.objects.get(node=self.node).hour_mask, sum(1 << hour for hour in range(10, 18))
+        )
+
+    def test_node_delete_skips_rebuild(self):
+        # Measures have no delete receivers, so cascades keep Django's fast delete
+        self.assertTrue(Collector(using='default', origin=None).can_fast_delete(Measures.objects.all()))
+        # One DELETE per table, without loading measures or rebuilding anything
+        with self.assertNumQueries(3), self.captureOnCommitCallbacks(execute=True):
+            self.node.delete()
+        self.assertFalse(NodeDayCompleteness.objects.filter(node_id=self.node.id).exists())
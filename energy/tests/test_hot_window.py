@@ -0,0 +1,169 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+
+from energy import hotwindow
+from energy.models import Grid, GridRegion, GridNode, Measures, MeasuresImport
+
+
+@override_settings(
+    MEASURES_HOT_WINDOW_DAYS=3,
+    MEASURES_HOT_WINDOW_FORWARD_DAYS=1,
+    MEASURES_HOT_WINDOW_POLL_SECONDS=3600,
+)
+class HotWindowTests(TestCase):
+    """Latest-mode queries answered from the hot window match the database path"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = timezone.now().astimezone(dt_timezone.utc).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        grid = Grid.objects.create(name='Grid1')
+        cls.nodes = []
+        for r in range(2):
+            region = GridRegion.objects.create(grid=grid, name=f'Region{r}')
+            # Equally named nodes in both regions exercise the ordering tie-break
+            for name in ('NodeB', 'NodeA'):
+                cls.nodes.append(GridNode.objects.create(region=region, name=name))
+
+        measures = []
+        for n, node in enumerate(cls.nodes):
+            for hour in range(-72, 48, 5):
+                timestamp = cls.today + timedelta(hours=hour)
+                for revision in range(3):
+                    measures.append(Measures(
+                        node=node,
+                        timestamp=timestamp,
+                        # Every revision is collected before today
+                        collected_at=timestamp - timedelta(hours=60 - revision * 6),
+                        value=Decimal(f'{(hour * 7 + revision - n) * 13}.{revision}25'),
+                    ))
+        Measures.objects.bulk_create(measures)
+
+    def setUp(self):
+        hotwindow._store = None
+        self.addCleanup(setattr, hotwindow, '_store', None)
+        self.store = hotwindow.get_store()
+        self.store.load()
+
+    def query(self, **params):
+        return self.client.get(reverse('measures-query'), params).json()
+
+    def db_query(self, **params):
+        with self.settings(MEASURES_HOT_WINDOW_DAYS=0):
+            return self.query(**params)
+
+    def assert_matches_db(self, start, end, **filters):
+        params = dict(filters, start_datetime=start.isoformat(), end_datetime=end.isoformat())
+        self.assertIsNotNone(self.store.query(start, end, **filters))
+        with self.assertNumQueries(0):
+            hot = self.query(**params)
+        db = self.db_query(**params)
+        self.assertEqual(hot, db)
+        self.assertTrue(hot['results'])
+
+    def test_matches_database(self):
+        start = self.today - timedelta(days=2)
+        end = self.today + timedelta(hours=30, minutes=30)
+        self.assert_matches_db(start, end)
+        self.assert_matches_db(start, end, node_id=self.nodes[1].id)
+        self.assert_matches_db(start, end, region_id=self.nodes[2].region_id)
+        self.assert_matches_db(start, end, grid_id=self.nodes[0].region.grid_id)
+
+    def test_ranges_outside_window_use_database(self):
+        start = self.today - timedelta(days=3)
+        self.assertIsNone(self.store.query(start, self.today))
+        self.assertIsNone(self.store.query(self.today, self.today + timedelta(days=2)))
+
+    def test_follows_writes(self):
+        timestamp = self.today + timedelta(hours=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Measures.objects.create(
+                node=self.nodes[0], timestamp=timestamp,
+                collected_at=timestamp, value=Decimal('-1.5'),
+            )
+            Measures.objects.create(
+                node=self.nodes[0], timestamp=self.today + timedelta(hours=6),
+                collected_at=self.today, value=Decimal('2.000'),
+            )
+            Measures.objects.filter(
+                node=self.nodes[1], timestamp=timestamp
+            ).order_by('-collected_at').first().delete()
+            # Queryset deletes reload the whole node-day
+            Measures.objects.filter(
+                node=self.nodes[2], timestamp__gte=timestamp, timestamp__lt=timestamp + timedelta(hours=8)
+            ).delete()
+        self.assert_matches_db(self.today, self.today + timedelta(hours=23))
+
+    def test_polls_rows_written_elsewhere(self):
+        timestamp = self.today + timedelta(hours=10)
+        # bulk_create sends no signals, like a write from another process
+        Measures.objects.bulk_create([Measures(
+            node=self.nodes[3], timestamp=timestamp,
+            collected_at=timezone.now(), value=Decimal('42.042'),
+        )])
+        self.store.poll()
+        self.assert_matches_db(self.today, self.today + timedelta(hours=23))
+
+    def test_imports_into_window_mark_stale(self):
+        # Like import_measures: a backfill older than the watermark, then its marker
+        timestamp = self.today + timedelta(hours=11)
+        Measures.objects.bulk_create([Measures(
+            node=self.nodes[1], timestamp=timestamp,
+            collected_at=self.today - timedelta(days=30), value=Decimal('7.000'),
+        )])
+        MeasuresImport.objects.create(
+            rows=1, first_timestamp=self.today - timedelta(days=40),
+            last_timestamp=self.today - timedelta(days=30),
+        )
+        self.store.poll()
+        self.assertFalse(self.store.stale)
+
+        MeasuresImport.objects.create(rows=1, first_timestamp=timestamp, last_timestamp=timestamp)
+        self.store.poll()
+        self.assertTrue(self.store.stale)
+
+        self.store.load()
+        self.assert_matches_db(self.today, self.today + timedelta(hours=23))
+        self.store.poll()
+        self.assertFalse(self.store.stale)
+
+    def test_hierarchy_changes_reload_in_background(self):
+        # update() sends no signals, like a rename in another process
+        GridNode.objects.filter(pk=self.nodes[0].pk).update(name='NodeC')
+        self.store.poll()
+        self.assertTrue(self.store.stale)
+
+        end = self.today + timedelta(hours=23)
+        with mock.patch.object(hotwindow.threading, 'Thread') as thread:
+            # The database answers until the reload is done
+            self.assertIsNone(self.store.query(self.today, end))
+            self.assertIsNone(self.store.query(self.today, end))
+        thread.assert_called_once_with(
+            target=self.store._background_load, name='hot-window-load', daemon=True
+        )
+
+        self.store.reloading = False
+        self.store.load()
+        self.assert_matches_db(self.today, end)
+        self.assertIn('NodeC', self.store.node_names)
+
+    def test_writes_during_load_are_replayed(self):
+        timestamp = self.today + timedelta(hours=4)
+        fill = hotwindow.HotWindowStore._fill
+
+        def fill_then_write(store):
+            fill(store)
+            with self.captureOnCommitCallbacks(execute=True):
+                Measures.objects.create(
+                    node=self.nodes[2], timestamp=timestamp,
+                    collected_at=timestamp, value=Decimal('7.5'),
+                )
+
+        with mock.patch.object(hotwindow.HotWindowStore, '_fill', fill_then_write):
+            self.store.load()
+        self.assert_matches_db(self.today, self.today + timedelta(hours=23))
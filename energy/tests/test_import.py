@@ -0,0 +1,150 @@
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from pathlib import Path
+from unittest import skipIf, skipUnless
+import queue
+import shutil
+import tempfile
+import uuid
+
+from energy.management.commands.import_measures import build_node_lookup, import_file, parse_row
+from energy.models import Grid, GridRegion, GridNode, Measures, MeasuresImport, NodeDayCompleteness
+
+NODE_ID = str(uuid.uuid4())
+LOOKUP = {('Grid1', 'Region1', 'Node1'): NODE_ID}
+
+
+def row(**values):
+    values.setdefault('node_id', NODE_ID)
+    values.setdefault('timestamp', '2024-01-01T10:00:00+00:00')
+    values.setdefault('collected_at', '2024-01-01T09:00:00+00:00')
+    values.setdefault('value', '12.5')
+    return values
+
+
+class ParseRowTests(SimpleTestCase):
+    """parse_row validates input rows and names the reject reason"""
+
+    def parse(self, **values):
+        return parse_row(row(**values), LOOKUP, set(LOOKUP.values()))
+
+    def assertRejected(self, reason, **values):
+        with self.assertRaisesMessage(ValueError, reason):
+            self.parse(**values)
+
+    def test_valid_row(self):
+        self.assertEqual(self.parse(), (
+            NODE_ID,
+            datetime(2024, 1, 1, 10, tzinfo=dt_timezone.utc),
+            datetime(2024, 1, 1, 9, tzinfo=dt_timezone.utc),
+            Decimal('12.5'),
+        ))
+
+    def test_node_names(self):
+        parsed = self.parse(node_id='', grid='Grid1', region='Region1', node='Node1')
+        self.assertEqual(parsed[0], NODE_ID)
+        self.assertRejected('unknown node', node_id='', grid='Grid1', region='Region2', node='Node1')
+
+    def test_node_id(self):
+        self.assertEqual(self.parse(node_id=NODE_ID.upper())[0], NODE_ID)
+        self.assertRejected('unknown node', node_id=str(uuid.uuid4()))
+        self.assertRejected('unknown node', node_id='not-a-uuid')
+
+    def test_naive_datetimes_are_utc(self):
+        parsed = self.parse(timestamp='2024-01-01 10:00:00', collected_at=datetime(2024, 1, 1, 9))
+        self.assertEqual(parsed[1], datetime(2024, 1, 1, 10, tzinfo=dt_timezone.utc))
+        self.assertEqual(parsed[2], datetime(2024, 1, 1, 9, tzinfo=dt_timezone.utc))
+
+    def test_invalid_datetimes(self):
+        self.assertRejected('invalid datetime', timestamp='yesterday')
+        self.assertRejected('invalid datetime', collected_at=None)
+        values = row()
+        del values['collected_at']
+        with self.assertRaisesMessage(ValueError, 'invalid datetime'):
+            parse_row(values, LOOKUP, set(LOOKUP.values()))
+
+    def test_invalid_values(self):
+        self.assertRejected('invalid value', value='abc')
+        self.assertRejected('invalid value', value='NaN')
+        self.assertRejected('invalid value', value='1000000000')
+        self.assertEqual(self.parse(value=' -999999999.999 ')[3], Decimal('-999999999.999'))
+
+
+class ImportMeasuresTests(TestCase):
+    """Node lookup and the staging-table merge"""
+
+    @classmethod
+    def setUpTestData(cls):
+        grid = Grid.objects.create(name='Grid1')
+        region = GridRegion.objects.create(grid=grid, name='Region1')
+        cls.node = GridNode.objects.create(region=region, name='Node1')
+        other_grid = Grid.objects.create(name='Grid2')
+        other_region = GridRegion.objects.create(grid=other_grid, name='Region1')
+        cls.other_node = GridNode.objects.create(region=other_region, name='Node1')
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_csv(self, name, lines):
+        path = self.directory / name
+        path.write_text('\n'.join(['grid,region,node,timestamp,collected_at,value'] + lines) + '\n')
+        return str(path)
+
+    def test_node_lookup(self):
+        with self.assertNumQueries(1):
+            lookup = build_node_lookup()
+        self.assertEqual(lookup, {
+            ('Grid1', 'Region1', 'Node1'): str(self.node.id),
+            ('Grid2', 'Region1', 'Node1'): str(self.other_node.id),
+        })
+
+    @skipIf(connection.vendor == 'postgresql', 'only checks the error on other databases')
+    def test_requires_postgresql(self):
+        path = self.write_csv('empty.csv', [])
+        with self.assertRaisesMessage(CommandError, 'requires PostgreSQL'):
+            call_command('import_measures', path)
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY and ON CONFLICT need PostgreSQL')
+    def test_merge(self):
+        Measures.objects.create(
+            node=self.node,
+            timestamp=datetime(2024, 1, 1, 10, tzinfo=dt_timezone.utc),
+            collected_at=datetime(2024, 1, 1, 9, tzinfo=dt_timezone.utc),
+            value=Decimal('1'),
+        )
+        path = self.write_csv('measures.csv', [
+            'Grid1,Region1,Node1,2024-01-01T10:00:00Z,2024-01-01T09:00:00Z,2',
+            'Grid1,Region1,Node1,2024-01-01T11:00:00Z,2024-01-01T09:00:00Z,3',
+            'Grid9,Region1,Node1,2024-01-01T11:00:00Z,2024-01-01T09:00:00Z,4',
+            'Grid2,Region1,Node1,2024-01-01T11:00:00Z,2024-01-01T09:00:00Z,abc',
+            # Repeats the first line; the later line wins
+            'Grid1,Region1,Node1,2024-01-01T10:00:00Z,2024-01-01T09:00:00Z,5',
+        ])
+        progress = queue.Queue()
+
+        result = import_file(path, build_node_lookup(), batch_size=2, progress=progress)
+
+        self.assertEqual(result['rows_read'], 5)
+        self.assertEqual(result['rows_staged'], 3)
+        self.assertEqual(result['rows_merged'], 2)
+        self.assertEqual(result['rejects'], {'unknown node': 1, 'invalid value': 1})
+        # One report per full COPY batch
+        self.assertEqual(progress.get_nowait(), (path, 2, 2))
+        self.assertTrue(progress.empty())
+
+        self.assertEqual(
+            list(Measures.objects.order_by('timestamp').values_list('timestamp__hour', 'value')),
+            [(10, Decimal('5')), (11, Decimal('3'))]
+        )
+        completeness = NodeDayCompleteness.objects.get(node=self.node)
+        self.assertEqual(completeness.hour_mask, (1 << 10) | (1 << 11))
+
+        merge = MeasuresImport.objects.get()
+        self.assertEqual(merge.rows, 2)
+        self.assertEqual(merge.first_timestamp, datetime(2024, 1, 1, 10, tzinfo=dt_timezone.utc))
+        self.assertEqual(merge.last_timestamp, datetime(2024, 1, 1, 11, tzinfo=dt_timezone.utc))
@@ -0,0 +1,172 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings, skipUnlessDBFeature
+from django.urls import reverse
+from django.utils import timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+import json
+import os
+import shutil
+import tempfile
+import uuid
+
+from energy import jobs
+from energy.models import Grid, GridRegion, GridNode, Measures, MeasuresQueryJob
+
+
+class MeasuresJobAPITests(TestCase):
+    """Background query jobs run in chunks and expose their result file"""
+
+    @classmethod
+    def setUpTestData(cls):
+        grid = Grid.objects.create(name='Grid1')
+        region = GridRegion.objects.create(grid=grid, name='Region1')
+        cls.node = GridNode.objects.create(region=region, name='Node1')
+        cls.collected_at = datetime(2024, 1, 1, 9, tzinfo=dt_timezone.utc)
+        for hour in range(72):
+            Measures.objects.create(
+                node=cls.node,
+                timestamp=datetime(2024, 1, 2, tzinfo=dt_timezone.utc) + timedelta(hours=hour),
+                collected_at=cls.collected_at,
+                value=Decimal(hour),
+            )
+
+    def setUp(self):
+        self.jobs_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.jobs_dir)
+        settings_override = override_settings(
+            MEASURES_JOBS_DIR=self.jobs_dir,
+            MEASURES_JOBS_CHUNK_HOURS=24,
+            MEASURES_JOBS_MAX_ACTIVE=2,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def submit(self, **params):
+        params.setdefault('start_datetime', '2024-01-02T00:00:00Z')
+        params.setdefault('end_datetime', '2024-01-04T23:00:00Z')
+        params.setdefault('collected_datetime', '2024-01-01T09:00:00Z')
+        return self.client.post(reverse('measures-jobs'), params)
+
+    def test_job_lifecycle(self):
+        response = self.submit(format='json')
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['id']
+        self.assertEqual(response.json()['status'], 'pending')
+
+        result_url = reverse('measures-job-result', args=[job_id])
+        self.assertEqual(self.client.get(result_url).status_code, 409)
+
+        # The worker pool only picks jobs up on commit, which TestCase never does
+        jobs.run_job(job_id)
+
+        status_data = self.client.get(reverse('measures-job-detail', args=[job_id])).json()
+        self.assertEqual(status_data['status'], 'succeeded')
+        self.assertEqual(status_data['chunks_total'], 3)
+        self.assertEqual(status_data['progress'], 1.0)
+        self.assertEqual(status_data['rows'], 72)
+
+        response = self.client.get(result_url)
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(results), 72)
+        self.assertEqual(results[0]['timestamp'], '2024-01-02T00:00:00Z')
+        self.assertEqual(results[0]['node_name'], 'Node1')
+        self.assertEqual(Decimal(results[-1]['value']), Decimal(71))
+
+    @skipUnlessDBFeature('can_distinct_on_fields')
+    def test_latest_job_matches_query_endpoint(self):
+        # Newer revisions for part of the range, and an equally named node elsewhere
+        other_region = GridRegion.objects.create(grid=self.node.region.grid, name='Region2')
+        other_node = GridNode.objects.create(region=other_region, name='Node1')
+        for hour in range(0, 72, 5):
+            for node in (self.node, other_node):
+                Measures.objects.create(
+                    node=node,
+                    timestamp=datetime(2024, 1, 2, tzinfo=dt_timezone.utc) + timedelta(hours=hour),
+                    collected_at=self.collected_at + timedelta(hours=hour % 3 + 1),
+                    value=Decimal(-hour),
+                )
+        params = {'start_datetime': '2024-01-02T00:00:00Z', 'end_datetime': '2024-01-04T23:00:00Z'}
+        response = self.client.post(reverse('measures-jobs'), dict(params, format='json'))
+        job_id = response.json()['id']
+        jobs.run_job(job_id)
+
+        response = self.client.get(reverse('measures-job-result', args=[job_id]))
+        job_results = json.loads(b''.join(response.streaming_content))
+        with self.settings(MEASURES_HOT_WINDOW_DAYS=0):
+            query_results = self.client.get(reverse('measures-query'), params).json()['results']
+
+        def rows(results):
+            return [
+                (item['id'], item['node_name'], item['region_name'], item['grid_name'],
+                 item['timestamp'], item['collected_at'], Decimal(item['value']))
+                for item in results
+            ]
+        self.assertEqual(len(job_results), 72 + 15)
+        self.assertEqual(rows(job_results), rows(query_results))
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.submit(format='xml').status_code, 400)
+        self.assertEqual(self.submit(end_datetime='2024-01-01T00:00:00Z').status_code, 400)
+
+    def test_concurrency_limit(self):
+        self.assertEqual(self.submit().status_code, 202)
+        self.assertEqual(self.submit().status_code, 202)
+        self.assertEqual(self.submit().status_code, 429)
+
+    def test_abandoned_jobs_free_their_slot(self):
+        self.submit()
+        self.submit()
+        self.assertEqual(self.submit().status_code, 429)
+
+        # The process owning both jobs stopped sending heartbeats
+        MeasuresQueryJob.objects.update(
+            heartbeat_at=timezone.now() - timedelta(seconds=settings.MEASURES_JOBS_ABANDONED_SECONDS + 1)
+        )
+        self.assertEqual(self.submit().status_code, 202)
+        self.assertEqual(
+            MeasuresQueryJob.objects.filter(status='failed', error='Job was abandoned').count(), 2
+        )
+
+    def test_heartbeat_keeps_owned_jobs_alive(self):
+        job_id = uuid.UUID(self.submit().json()['id'])
+        MeasuresQueryJob.objects.update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        jobs._owned_jobs.add(job_id)
+        self.addCleanup(jobs._owned_jobs.discard, job_id)
+
+        jobs.heartbeat()
+        self.assertEqual(jobs.fail_abandoned_jobs(), 0)
+        self.assertEqual(MeasuresQueryJob.objects.get(id=job_id).status, 'pending')
+
+    def test_expired_result_is_gone(self):
+        job_id = self.submit(format='csv').json()['id']
+        jobs.run_job(job_id)
+        MeasuresQueryJob.objects.filter(id=job_id).update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        # Not cleaned up yet, but no longer served
+        response = self.client.get(reverse('measures-job-result', args=[job_id]))
+        self.assertEqual(response.status_code, 410)
+
+        stdout = StringIO()
+        call_command('cleanup_measures_jobs', stdout=stdout)
+        self.assertIn('deleted 1 expired job(s)', stdout.getvalue())
+        self.assertFalse(MeasuresQueryJob.objects.filter(id=job_id).exists())
+
+    def test_cleanup_removes_expired_results(self):
+        job_id = self.submit(format='csv').json()['id']
+        jobs.run_job(job_id)
+        job = MeasuresQueryJob.objects.get(id=job_id)
+        self.assertTrue(os.path.exists(job.result_path))
+
+        MeasuresQueryJob.objects.filter(id=job_id).update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(jobs.cleanup_expired_jobs(), 1)
+        self.assertFalse(os.path.exists(job.result_path))
+        self.assertEqual(
+            self.client.get(reverse('measures-job-detail', args=[job_id])).status_code, 404
+        )
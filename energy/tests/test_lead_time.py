@@ -0,0 +1,75 @@
+from django.test import TestCase
+from django.urls import reverse
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from energy.models import Grid, GridRegion, GridNode, Measures
+
+
+class MeasuresLeadTimeAPITests(TestCase):
+    """Lead-time slices pick the newest revision collected before each timestamp's cutoff"""
+
+    @classmethod
+    def setUpTestData(cls):
+        grid = Grid.objects.create(name='Grid1')
+        region = GridRegion.objects.create(grid=grid, name='Region1')
+        cls.node = GridNode.objects.create(region=region, name='Node1')
+        other_region = GridRegion.objects.create(grid=grid, name='Region2')
+        cls.other_node = GridNode.objects.create(region=other_region, name='Node1')
+
+        cls.day = datetime(2024, 1, 2, tzinfo=dt_timezone.utc)
+        # Revisions collected at 00:00, 06:00, 12:00 and 18:00 of the day before
+        # and 00:00 of the delivery day, valued after their collection hour
+        for node in (cls.node, cls.other_node):
+            for hour in range(24):
+                for collected_hour in (0, 6, 12, 18, 24):
+                    Measures.objects.create(
+                        node=node,
+                        timestamp=cls.day + timedelta(hours=hour),
+                        collected_at=cls.day - timedelta(days=1) + timedelta(hours=collected_hour),
+                        value=Decimal(collected_hour),
+                    )
+
+    def get(self, **params):
+        params.setdefault('start_datetime', '2024-01-02T00:00:00Z')
+        params.setdefault('end_datetime', '2024-01-02T23:00:00Z')
+        return self.client.get(reverse('measures-lead-time'), params)
+
+    def test_requires_exactly_one_of_lead_or_cutoff_time(self):
+        self.assertEqual(self.get().status_code, 400)
+        self.assertEqual(self.get(lead='01:00:00', cutoff_time='09:00').status_code, 400)
+
+    def test_rejects_negative_lead(self):
+        self.assertEqual(self.get(lead='-01:00:00').status_code, 400)
+
+    def test_fixed_lead(self):
+        response = self.get(lead='30:00:00', node_id=str(self.node.id))
+        self.assertEqual(response.status_code, 200)
+        values = {
+            item['timestamp']: Decimal(item['value']) for item in response.json()['results']
+        }
+        # 00:00 needs a revision from 18:00 two days before, which does not exist
+        self.assertNotIn('2024-01-02T00:00:00Z', values)
+        self.assertEqual(values['2024-01-02T06:00:00Z'], Decimal(0))
+        self.assertEqual(values['2024-01-02T18:00:00Z'], Decimal(12))
+        self.assertEqual(values['2024-01-02T23:00:00Z'], Decimal(12))
+
+    def test_daily_cutoff_with_hierarchy_filter(self):
+        response = self.get(cutoff_time='09:00', region_id=str(self.node.region_id))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 24)
+        self.assertEqual({item['region_name'] for item in data['results']}, {'Region1'})
+        self.assertEqual({Decimal(item['value']) for item in data['results']}, {Decimal(6)})
+
+    def test_equally_named_nodes_are_ordered_by_id(self):
+        response = self.get(lead='00:00:00')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(len(results), 48)
+        expected = sorted([self.node, self.other_node], key=lambda node: node.id)
+        self.assertEqual(
+            [item['region_name'] for item in results[:2]],
+            [node.region.name for node in expected]
+        )
+        self.assertEqual({Decimal(item['value']) for item in results}, {Decimal(24)})
@@ -0,0 +1,342 @@
+"""
+Query-count and query-plan regression tests for the read endpoints.
+
+Every case requests an endpoint against a mid-sized dataset and asserts an
+upper bound on the number of SQL queries, which catches N+1 queries in
+serializers and views on any database.
+
+On PostgreSQL the statements that read `measures` are also run through
+EXPLAIN (FORMAT JSON). A case fails when such a plan scans `measures`
+sequentially or uses none of its indexes. The plans, reduced to node types,
+relations and index names, are kept as snapshots in tests/plans/<case>.json
+so that plan changes show up in review. A missing or changed snapshot
+fails the case; run with UPDATE_PLAN_SNAPSHOTS=1 to write new snapshots.
+"""
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+import json
+import os
+import re
+import shutil
+import tempfile
+import uuid
+
+from energy.models import Grid, GridRegion, GridNode, Measures, MeasuresQueryJob, NodeDayCompleteness
+
+PLANS_DIR = Path(__file__).resolve().parent / 'plans'
+UPDATE_SNAPSHOTS = os.environ.get('UPDATE_PLAN_SNAPSHOTS') == '1'
+
+MEASURES_TABLE = Measures._meta.db_table
+MEASURES_SQL = re.compile(r'\b(FROM|JOIN)\s+"%s"' % MEASURES_TABLE)
+# Scans of measures that read it through an index (the Bitmap Index Scan under
+# a Bitmap Heap Scan names only the index, not the table)
+INDEX_SCANS = {'Index Scan', 'Index Only Scan', 'Bitmap Heap Scan'}
+
+START = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+DAYS = 28
+REVISIONS = 4
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+def walk(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from walk(child)
+
+
+def normalize(plan):
+    """
+    Reduce a plan to what matters for review: node types, relations, index
+    names and join types. Runs of identical children (e.g. the arms of a
+    BitmapOr) are collapsed into one entry with a repeat count.
+    """
+    node = {'Node Type': plan['Node Type']}
+    for key in ('Relation Name', 'Index Name', 'Join Type', 'Strategy'):
+        if key in plan:
+            node[key] = plan[key]
+
+    children = []
+    for child in plan.get('Plans', []):
+        child = normalize(child)
+        previous = children[-1] if children else None
+        if previous is not None and dict(previous, repeat=1) == dict(child, repeat=1):
+            previous['repeat'] = previous.get('repeat', 1) + 1
+        else:
+            children.append(child)
+    if children:
+        node['Plans'] = children
+    return node
+
+
+class QueryPlanTestCase(TestCase):
+    """
+    Seeds 27 nodes with four revisions of hourly data over four weeks and
+    provides `assertQueryBudget` for the endpoint cases below.
+
+    The data is committed before the class transaction starts and deleted
+    after it, so that PostgreSQL can VACUUM and fully ANALYZE the tables:
+    the plans then do not depend on earlier tests or on sampling.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            cls.seed()
+            super().setUpClass()
+        except Exception:
+            cls.unseed()
+            raise
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.unseed()
+
+    @classmethod
+    def seed(cls):
+        tables = [model._meta.db_table for model in (Grid, GridRegion, GridNode, Measures, NodeDayCompleteness)]
+        if connection.vendor == 'postgresql':
+            # Empty now, but rolled back rows of earlier tests still take up pages
+            with connection.cursor() as cursor:
+                cursor.execute('TRUNCATE ' + ', '.join(f'"{table}"' for table in tables))
+
+        cls.grids = []
+        cls.regions = []
+        cls.nodes = []
+        # Ids in creation order, so measures is stored in node_id order whatever ids are drawn
+        node_ids = iter(sorted(uuid.uuid4() for _ in range(27)))
+        for g in range(1, 4):
+            grid = Grid.objects.create(name=f'Grid{g}')
+            cls.grids.append(grid)
+            for r in range(1, 4):
+                region = GridRegion.objects.create(grid=grid, name=f'Region{r}')
+                cls.regions.append(region)
+                for n in range(1, 4):
+                    cls.nodes.append(GridNode.objects.create(id=next(node_ids), region=region, name=f'Node{n}'))
+
+        cls.collected_at = [START - timedelta(days=1) + timedelta(hours=6 * i) for i in range(REVISIONS)]
+        measures = []
+        for n, node in enumerate(cls.nodes):
+            for hour in range(DAYS * 24):
+                timestamp = START + timedelta(hours=hour)
+                for revision, collected_at in enumerate(cls.collected_at):
+                    measures.append(Measures(
+                        node=node,
+                        timestamp=timestamp,
+                        collected_at=collected_at + timedelta(days=hour // 24),
+                        value=Decimal((n * 31 + hour * 7 + revision) % 1000),
+                    ))
+        Measures.objects.bulk_create(measures, batch_size=5000)
+        call_command('rebuild_completeness', stdout=StringIO())
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # Samples every row (300 per unit of target) instead of a random subset
+                cursor.execute('SET default_statistics_target = 1000')
+                for table in tables:
+                    cursor.execute(f'VACUUM ANALYZE "{table}"')
+                cursor.execute('RESET default_statistics_target')
+
+    @classmethod
+    def unseed(cls):
+        # Cascades to the measures and completeness rows
+        Grid.objects.all().delete()
+
+    def assertQueryBudget(self, name, url, params=None, max_queries=1, require_index=True):
+        """
+        Request `url` and assert it runs at most `max_queries` queries. On
+        PostgreSQL also snapshot the plans of the statements that read
+        measures and, unless require_index is False, check that they use an
+        index rather than a sequential scan.
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params or {})
+        if response.status_code >= 300:
+            self.fail(f'{name} returned {response.status_code}: {response.content[:500]}')
+        self.assertLessEqual(
+            len(context.captured_queries), max_queries,
+            f'{name} ran {len(context.captured_queries)} queries (budget {max_queries}):\n'
+            + '\n'.join(query['sql'] for query in context.captured_queries)
+        )
+
+        if connection.vendor == 'postgresql':
+            statements = [
+                query['sql'] for query in context.captured_queries
+                if query['sql'].lstrip().upper().startswith('SELECT')
+                and MEASURES_SQL.search(query['sql'])
+            ]
+            self.assertPlans(name, statements, require_index)
+        return response
+
+    def assertPlans(self, name, statements, require_index=True):
+        if not statements:
+            return
+        snapshot = []
+        for sql in statements:
+            plan = explain(sql)
+            if require_index:
+                nodes = list(walk(plan))
+                measures_nodes = [node for node in nodes if node.get('Relation Name') == MEASURES_TABLE]
+                seq_scans = [node for node in measures_nodes if node['Node Type'] == 'Seq Scan']
+                self.assertFalse(seq_scans, f'{name}: sequential scan on {MEASURES_TABLE}:\n{sql}')
+                self.assertTrue(
+                    any(node['Node Type'] in INDEX_SCANS for node in measures_nodes),
+                    f'{name}: no index used on {MEASURES_TABLE}:\n{sql}'
+                )
+            snapshot.append(normalize(plan))
+
+        path = PLANS_DIR / f'{name}.json'
+        if UPDATE_SNAPSHOTS:
+            PLANS_DIR.mkdir(exist_ok=True)
+            path.write_text(json.dumps(snapshot, indent=2) + '\n')
+            return
+        self.assertTrue(
+            path.exists(),
+            f'{name}: no plan snapshot in {path}; rerun with UPDATE_PLAN_SNAPSHOTS=1 to create it'
+        )
+        expected = json.loads(path.read_text())
+        self.assertEqual(
+            snapshot, expected,
+            f'{name}: query plan changed; review it and rerun with UPDATE_PLAN_SNAPSHOTS=1 '
+            f'to accept the new plan in {path}'
+        )
+
+
+class MeasuresQueryPlanTests(QueryPlanTestCase):
+    """Latest and specific-collection modes of /measures/query/ and /measures/evolution/"""
+
+    def range_params(self, hours, **params):
+        start = START + timedelta(days=10)
+        params.setdefault('start_datetime', start.isoformat())
+        params.setdefault('end_datetime', (start + timedelta(hours=hours - 1)).isoformat())
+        return params
+
+    def test_query_latest_node(self):
+        self.assertQueryBudget(
+            'query_latest_node', reverse('measures-query'),
+            self.range_params(24, node_id=self.nodes[4].id), max_queries=2
+        )
+
+    def test_query_latest_region(self):
+        self.assertQueryBudget(
+            'query_latest_region', reverse('measures-query'),
+            self.range_params(6, region_id=self.regions[2].id), max_queries=2
+        )
+
+    def test_query_latest_all_nodes(self):
+        self.assertQueryBudget(
+            'query_latest_all_nodes', reverse('measures-query'),
+            self.range_params(3), max_queries=2
+        )
+
+    def test_query_collected_datetime(self):
+        collected_at = self.collected_at[2] + timedelta(days=10)
+        self.assertQueryBudget(
+            'query_collected_datetime', reverse('measures-query'),
+            self.range_params(24, collected_datetime=collected_at.isoformat(),
+                              grid_id=self.grids[0].id),
+            max_queries=1
+        )
+
+    def test_evolution(self):
+        collected_at = self.collected_at[1] + timedelta(days=10)
+        self.assertQueryBudget(
+            'evolution', reverse('measures-evolution'),
+            self.range_params(24, collected_datetime=collected_at.isoformat(),
+                              region_id=self.regions[0].id),
+            max_queries=1
+        )
+
+
+class LeadTimeQueryPlanTests(QueryPlanTestCase):
+    """Both cutoff modes of /measures/lead-time/"""
+
+    def test_lead(self):
+        self.assertQueryBudget('lead_time_lead', reverse('measures-lead-time'), {
+            'start_datetime': (START + timedelta(days=12)).isoformat(),
+            'end_datetime': (START + timedelta(days=12, hours=23)).isoformat(),
+            'lead': '30:00:00',
+            'node_id': self.nodes[0].id,
+        }, max_queries=1)
+
+    def test_cutoff_time(self):
+        self.assertQueryBudget('lead_time_cutoff', reverse('measures-lead-time'), {
+            'start_datetime': (START + timedelta(days=12)).isoformat(),
+            'end_datetime': (START + timedelta(days=12, hours=23)).isoformat(),
+            'cutoff_time': '09:00',
+            'region_id': self.regions[4].id,
+        }, max_queries=1)
+
+
+class OtherEndpointQueryPlanTests(QueryPlanTestCase):
+    """Query budgets of the remaining read endpoints"""
+
+    def test_gaps(self):
+        # Served from the completeness index, so it must never touch measures
+        response = self.assertQueryBudget('gaps', reverse('measures-gaps'), {
+            'start_datetime': START.isoformat(),
+            'end_datetime': (START + timedelta(days=DAYS + 1)).isoformat(),
+            'region_id': self.regions[0].id,
+            'stale_before': (START + timedelta(days=20)).isoformat(),
+        }, max_queries=2)
+        # The range runs one day and one hour past the seeded data
+        self.assertEqual(response.json()['results'][0]['missing_hours'], 25)
+
+    def test_measures_list(self):
+        # Unpaginated and unfiltered, so reading all of measures is expected; the
+        # budget catches per-row queries and the snapshot records the plan
+        response = self.assertQueryBudget(
+            'measures_list', reverse('measures-list'), max_queries=1, require_index=False
+        )
+        self.assertEqual(len(response.json()), len(self.nodes) * DAYS * 24 * REVISIONS)
+
+    def test_measure_detail(self):
+        measure = Measures.objects.filter(node=self.nodes[0]).first()
+        self.assertQueryBudget(
+            'measure_detail', reverse('measures-detail', args=[measure.id]), max_queries=1
+        )
+
+    def test_hierarchy_lists(self):
+        self.assertQueryBudget('grids', reverse('grid-list'), max_queries=1)
+        self.assertQueryBudget('regions', reverse('gridregion-list'), max_queries=1)
+        self.assertQueryBudget('nodes', reverse('gridnode-list'), max_queries=1)
+
+    def test_job_status(self):
+        job = MeasuresQueryJob.objects.create(params={}, format='json')
+        self.assertQueryBudget(
+            'job_status', reverse('measures-job-detail', args=[job.id]), max_queries=1
+        )
+
+    def test_job_result(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        result_path = os.path.join(directory, 'result.json')
+        with open(result_path, 'w') as result:
+            result.write('[]')
+        job = MeasuresQueryJob.objects.create(
+            params={}, format='json', status=MeasuresQueryJob.STATUS_SUCCEEDED,
+            result_path=result_path, expires_at=START + timedelta(days=36500),
+        )
+        response = self.assertQueryBudget(
+            'job_result', reverse('measures-job-result', args=[job.id]), max_queries=1
+        )
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
+
+    def test_dashboard(self):
+        # Counting all measures is a full scan by definition, so plans are only snapshotted
+        self.assertQueryBudget('dashboard', reverse('dashboard'), max_queries=6, require_index=False)
@@ -0,0 +1,47 @@
+from django.test import SimpleTestCase
+
+from energy.serializers import (
+    MeasuresRangeQuerySerializer, MeasuresQuerySerializer, MeasuresLeadTimeQuerySerializer,
+    MeasuresGapsQuerySerializer, MeasuresJobCreateSerializer
+)
+
+QUERY_SERIALIZERS = [
+    (MeasuresQuerySerializer, {}),
+    (MeasuresLeadTimeQuerySerializer, {'lead': '24:00:00'}),
+    (MeasuresGapsQuerySerializer, {}),
+    (MeasuresJobCreateSerializer, {}),
+]
+
+
+class MeasuresQuerySerializerTests(SimpleTestCase):
+    """The measures query serializers share their range and hierarchy filters"""
+
+    def test_shared_fields(self):
+        shared = set(MeasuresRangeQuerySerializer().fields)
+        for serializer_class, extra in QUERY_SERIALIZERS:
+            with self.subTest(serializer=serializer_class.__name__):
+                self.assertTrue(issubclass(serializer_class, MeasuresRangeQuerySerializer))
+                self.assertLessEqual(shared, set(serializer_class().fields))
+
+    def test_range_validation(self):
+        for serializer_class, extra in QUERY_SERIALIZERS:
+            with self.subTest(serializer=serializer_class.__name__):
+                serializer = serializer_class(data=dict(
+                    extra,
+                    start_datetime='2024-01-02T00:00:00Z',
+                    end_datetime='2024-01-01T00:00:00Z',
+                ))
+                self.assertFalse(serializer.is_valid())
+                self.assertEqual(
+                    serializer.errors['non_field_errors'],
+                    ['start_datetime must be before end_datetime']
+                )
+
+                serializer = serializer_class(data=dict(
+                    extra,
+                    start_datetime='2024-01-01T00:00:00Z',
+                    end_datetime='2024-01-02T00:00:00Z',
+                    region_id='not-a-uuid',
+                ))
+                self.assertFalse(serializer.is_valid())
+                self.assertIn('region_id', serializer.errors)
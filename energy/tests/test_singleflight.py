@@ -0,0 +1,166 @@
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from unittest import skipIf
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from energy import singleflight
+from energy.serializers import MeasuresQuerySerializer
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('Timed out waiting for condition')
+        time.sleep(0.005)
+
+
+class SingleFlightBackendTests(SimpleTestCase):
+    """Identical concurrent calls share one computation"""
+
+    def setUp(self):
+        singleflight.reset_metrics()
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def compute(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        return {'calls': self.calls}
+
+    def start(self, backend, results, key='key', compute=None):
+        def target():
+            try:
+                results.append(backend.run(key, compute or self.compute))
+            except Exception as exc:
+                results.append(exc)
+        thread = threading.Thread(target=target)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        return thread
+
+    def test_followers_share_the_leaders_result(self):
+        backend = singleflight.ThreadBackend(timeout=5)
+        results = []
+        leader = self.start(backend, results)
+        self.started.wait(5)
+        followers = [self.start(backend, results) for _ in range(7)]
+        wait_until(lambda: backend.flights['key'].waiters == 7)
+        self.release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [{'calls': 1}] * 8)
+        self.assertEqual(backend.flights, {})
+        metrics = singleflight.get_metrics()
+        self.assertEqual((metrics['executed'], metrics['coalesced']), (1, 7))
+
+    def test_different_keys_do_not_wait(self):
+        backend = singleflight.ThreadBackend(timeout=5)
+        results = []
+        self.start(backend, results, key='a')
+        self.started.wait(5)
+        self.assertEqual(backend.run('b', lambda: 'b'), 'b')
+        self.release.set()
+
+    def test_follower_runs_query_when_leader_fails(self):
+        backend = singleflight.ThreadBackend(timeout=5)
+
+        def fail():
+            self.started.set()
+            self.release.wait(5)
+            raise RuntimeError('database went away')
+
+        results = []
+        self.start(backend, results, compute=fail)
+        self.started.wait(5)
+        follower = self.start(backend, results, compute=lambda: 'recovered')
+        wait_until(lambda: backend.flights['key'].waiters == 1)
+        self.release.set()
+        follower.join(5)
+
+        self.assertIsInstance(results[0], RuntimeError)
+        self.assertEqual(results[1], 'recovered')
+        self.assertEqual(singleflight.get_metrics()['fallbacks'], 1)
+
+    def test_follower_runs_query_after_timeout(self):
+        backend = singleflight.ThreadBackend(timeout=0.05)
+        results = []
+        self.start(backend, results)
+        self.started.wait(5)
+        with self.assertLogs('energy.singleflight', 'WARNING'):
+            self.assertEqual(backend.run('key', lambda: 'own'), 'own')
+        self.release.set()
+
+    @skipIf(singleflight.fcntl is None, 'fcntl is not available')
+    def test_file_backend_coalesces_across_processes(self):
+        # Two backends on one directory stand in for two worker processes
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        first = singleflight.FileBackend(timeout=5, directory=directory)
+        second = singleflight.FileBackend(timeout=5, directory=directory)
+        waiters_path = os.path.join(directory, 'key.waiters')
+        result_path = os.path.join(directory, 'key.pickle')
+        results = []
+        leader = self.start(first, results)
+        self.started.wait(5)
+        follower = self.start(second, results, compute=lambda: 'not shared')
+        wait_until(lambda: first._count_waiters(waiters_path) == 1)
+        self.release.set()
+        leader.join(5)
+        follower.join(5)
+
+        self.assertEqual(results, [{'calls': 1}, {'calls': 1}])
+        self.assertEqual(singleflight.get_metrics()['coalesced'], 1)
+        # The last waiter removes the shared result
+        self.assertEqual(first._count_waiters(waiters_path), 0)
+        self.assertFalse(os.path.exists(result_path))
+
+        # A later call does not reuse the landed flight's result, and without
+        # waiters nothing is written
+        self.assertEqual(second.run('key', lambda: 'fresh'), 'fresh')
+        self.assertFalse(os.path.exists(result_path))
+
+
+class SingleFlightViewTests(TestCase):
+    """Keys and metrics of the coalesced measures views"""
+
+    def key(self, **params):
+        serializer = MeasuresQuerySerializer(data=params)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        return singleflight.request_key('measures-query', serializer)
+
+    def test_key_normalises_parameters(self):
+        self.assertEqual(
+            self.key(start_datetime='2024-01-01T00:00:00Z', end_datetime='2024-01-02T00:00:00Z'),
+            self.key(end_datetime='2024-01-02T01:00:00+01:00', start_datetime='2024-01-01T00:00:00+00:00'),
+        )
+        self.assertNotEqual(
+            self.key(start_datetime='2024-01-01T00:00:00Z', end_datetime='2024-01-02T00:00:00Z'),
+            self.key(start_datetime='2024-01-01T00:00:00Z', end_datetime='2024-01-03T00:00:00Z'),
+        )
+
+    @override_settings(MEASURES_SINGLE_FLIGHT_BACKEND='none')
+    def test_disabled_backend_still_answers(self):
+        response = self.client.get(reverse('measures-query'), {
+            'start_datetime': '2024-01-01T00:00:00Z', 'end_datetime': '2024-01-02T00:00:00Z',
+        })
+        self.assertEqual(response.json()['count'], 0)
+
+    @override_settings(MEASURES_SINGLE_FLIGHT_BACKEND='thread')
+    def test_dashboard_reports_metrics(self):
+        singleflight.reset_metrics()
+        self.client.get(reverse('measures-query'), {
+            'start_datetime': '2024-01-01T00:00:00Z', 'end_datetime': '2024-01-02T00:00:00Z',
+        })
+        metrics = self.client.get(reverse('dashboard')).json()['single_flight']
+        self.assertEqual(metrics['backend'], 'thread')
+        self.assertEqual(metrics['executed'], 1)
+        self.assertEqual(metrics['coalesced'], 0)
@@ -9,10 +9,17 @@ router.register(r'regions', views.GridRegionViewSet)
 router.register(r'nodes', views.GridNodeViewSet)
 router.register(r'measures', views.MeasuresViewSet)
 
-# The API URLs are now determined automatically by the router
+# The API URLs are now determined automatically by the router.
+# Custom measures endpoints come first so the router's measures/<pk>/ route
+# does not swallow them.
 urlpatterns = [
-    path('', include(router.urls)),
     path('measures/query/', views.MeasuresAPIView.as_view(), name='measures-query'),
     path('measures/evolution/', views.MeasuresEvolutionAPIView.as_view(), name='measures-evolution'),
+    path('measures/lead-time/', views.MeasuresLeadTimeAPIView.as_view(), name='measures-lead-time'),
+    path('measures/gaps/', views.MeasuresGapsAPIView.as_view(), name='measures-gaps'),
+    path('measures/jobs/', views.MeasuresJobAPIView.as_view(), name='measures-jobs'),
+    path('measures/jobs/<uuid:job_id>/', views.MeasuresJobDetailAPIView.as_view(), name='measures-job-detail'),
+    path('measures/jobs/<uuid:job_id>/result/', views.MeasuresJobResultAPIView.as_view(), name='measures-job-result'),
     path('dashboard/', views.DashboardAPIView.as_view(), name='dashboard'),
+    path('', include(router.urls)),
 ] 
\ No newline at end of file
@@ -2,15 +2,25 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db.models import Max, Q
+from django.http import FileResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.db import connection
+from django.db.models import F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import TruncDay
 from django.utils import timezone
 from datetime import datetime, timedelta
+import os
 import pytz
 
-from .models import Grid, GridRegion, GridNode, Measures
+from . import hotwindow, jobs, singleflight
+from .completeness import find_gaps
+from .models import Grid, GridRegion, GridNode, Measures, MeasuresQueryJob
 from .serializers import (
     GridSerializer, GridRegionSerializer, GridNodeSerializer,
-    MeasuresSerializer, MeasuresQuerySerializer, MeasuresResponseSerializer
+    MeasuresSerializer, MeasuresQuerySerializer, MeasuresLeadTimeQuerySerializer,
+    MeasuresResponseSerializer, MeasuresJobCreateSerializer, MeasuresQueryJobSerializer,
+    MeasuresGapsQuerySerializer
 )
 
 
@@ -60,7 +70,38 @@ class MeasuresAPIView(APIView):
         node_id = data.get('node_id')
         grid_id = data.get('grid_id')
         region_id = data.get('region_id')
-        
+
+        # Latest values inside the in-memory hot window skip the database
+        store = hotwindow.get_store()
+        if store is not None and not collected_datetime:
+            results = store.query(
+                start_datetime, end_datetime,
+                node_id=node_id, region_id=region_id, grid_id=grid_id
+            )
+            if results is not None:
+                return Response({
+                    'count': len(results),
+                    'start_datetime': start_datetime,
+                    'end_datetime': end_datetime,
+                    'collected_datetime': collected_datetime,
+                    'results': results
+                })
+
+        # Identical concurrent requests share one database query
+        return Response(singleflight.run(
+            singleflight.request_key('measures-query', serializer),
+            lambda: self.query(data)
+        ))
+
+    def query(self, data):
+        """Response data for validated query parameters, read from the database"""
+        start_datetime = data['start_datetime']
+        end_datetime = data['end_datetime']
+        collected_datetime = data.get('collected_datetime')
+        node_id = data.get('node_id')
+        grid_id = data.get('grid_id')
+        region_id = data.get('region_id')
+
         # Build base queryset
         queryset = Measures.objects.select_related(
             'node', 'node__region', 'node__region__grid'
@@ -98,19 +139,20 @@ class MeasuresAPIView(APIView):
             
             queryset = queryset.filter(latest_filters)
         
-        # Order by timestamp and node for consistent results
-        queryset = queryset.order_by('timestamp', 'node__name')
+        # Order by timestamp and node for consistent results (node_id breaks
+        # ties between equally named nodes, matching the hot window order)
+        queryset = queryset.order_by('timestamp', 'node__name', 'node_id')
         
         # Serialize the results
         serializer = MeasuresResponseSerializer(queryset, many=True)
         
-        return Response({
+        return {
             'count': len(serializer.data),
             'start_datetime': start_datetime,
             'end_datetime': end_datetime,
             'collected_datetime': collected_datetime,
             'results': serializer.data
-        })
+        }
 
 
 class MeasuresEvolutionAPIView(APIView):
@@ -126,19 +168,27 @@ class MeasuresEvolutionAPIView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
         data = serializer.validated_data
+        if not data.get('collected_datetime'):
+            return Response(
+                {'error': 'collected_datetime is required for evolution queries'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Identical concurrent requests share one database query
+        return Response(singleflight.run(
+            singleflight.request_key('measures-evolution', serializer),
+            lambda: self.query(data)
+        ))
+
+    def query(self, data):
+        """Response data for validated query parameters"""
         start_datetime = data['start_datetime']
         end_datetime = data['end_datetime']
-        collected_datetime = data.get('collected_datetime')
+        collected_datetime = data['collected_datetime']
         node_id = data.get('node_id')
         grid_id = data.get('grid_id')
         region_id = data.get('region_id')
         
-        if not collected_datetime:
-            return Response(
-                {'error': 'collected_datetime is required for evolution queries'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
         # Build queryset
         queryset = Measures.objects.select_related(
             'node', 'node__region', 'node__region__grid'
@@ -156,22 +206,229 @@ class MeasuresEvolutionAPIView(APIView):
         if region_id:
             queryset = queryset.filter(node__region_id=region_id)
         
-        # Order by timestamp and node
-        queryset = queryset.order_by('timestamp', 'node__name')
+        # Order by timestamp and node (node_id breaks ties like /measures/query/)
+        queryset = queryset.order_by('timestamp', 'node__name', 'node_id')
         
         # Serialize the results
         serializer = MeasuresResponseSerializer(queryset, many=True)
         
-        return Response({
+        return {
             'count': len(serializer.data),
             'start_datetime': start_datetime,
             'end_datetime': end_datetime,
             'collected_datetime': collected_datetime,
             'evolution_type': 'specific_collection_time',
             'results': serializer.data
+        }
+
+
+class MeasuresLeadTimeAPIView(APIView):
+    """
+    API endpoint for fixed lead-time slices.
+
+    For each timestamp in the date range returns the newest value collected
+    at or before a cutoff derived from the timestamp itself:
+    1. lead: collected_at <= timestamp - lead (e.g. lead=24:00:00 for day-ahead)
+    2. cutoff_time: collected_at <= cutoff_time (UTC) on the day that is
+       cutoff_days_before days before the timestamp's day
+    """
+
+    def get(self, request):
+        """GET endpoint for lead-time queries"""
+        serializer = MeasuresLeadTimeQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Identical concurrent requests share one database query
+        return Response(singleflight.run(
+            singleflight.request_key('measures-lead-time', serializer),
+            lambda: self.query(serializer)
+        ))
+
+    def query(self, serializer):
+        """Response data for a validated MeasuresLeadTimeQuerySerializer"""
+        data = serializer.validated_data
+        start_datetime = data['start_datetime']
+        end_datetime = data['end_datetime']
+        lead = data.get('lead')
+        cutoff_time = data.get('cutoff_time')
+
+        if lead is not None:
+            cutoff = F('timestamp') - lead
+        else:
+            cutoff = TruncDay('timestamp') - timedelta(
+                days=data['cutoff_days_before'],
+            ) + timedelta(
+                hours=cutoff_time.hour,
+                minutes=cutoff_time.minute,
+                seconds=cutoff_time.second,
+            )
+
+        # Newest revision per node/timestamp collected before its cutoff
+        candidates = Measures.objects.filter(
+            timestamp__gte=start_datetime,
+            timestamp__lte=end_datetime,
+            collected_at__lte=cutoff,
+        ).for_hierarchy(
+            node_id=data.get('node_id'),
+            region_id=data.get('region_id'),
+            grid_id=data.get('grid_id'),
+        )
+        if connection.features.can_distinct_on_fields:
+            # DISTINCT ON over the (node, timestamp, collected_at) index
+            latest = candidates.latest_revisions()
+        else:
+            newest = candidates.filter(
+                node_id=OuterRef('node_id'), timestamp=OuterRef('timestamp')
+            ).order_by('-collected_at').values('id')[:1]
+            latest = candidates.filter(id=Subquery(newest))
+
+        # node_id breaks ties between equally named nodes, like /measures/query/
+        queryset = Measures.objects.select_related(
+            'node', 'node__region', 'node__region__grid'
+        ).filter(
+            id__in=latest.values('id')
+        ).order_by('timestamp', 'node__name', 'node_id')
+
+        # Serialize the results
+        results = MeasuresResponseSerializer(queryset, many=True).data
+
+        return {
+            'count': len(results),
+            'start_datetime': start_datetime,
+            'end_datetime': end_datetime,
+            'lead': serializer.data.get('lead'),
+            'cutoff_time': serializer.data.get('cutoff_time'),
+            'cutoff_days_before': data['cutoff_days_before'] if cutoff_time else None,
+            'results': results
+        }
+
+
+class MeasuresGapsAPIView(APIView):
+    """
+    API endpoint for data completeness.
+
+    Reports, per node, the hours in the date range that have no measures
+    (missing) or whose latest revision was collected before stale_before
+    (stale). Answered from the completeness index, not the measures table.
+    """
+
+    def get(self, request):
+        """GET endpoint for missing and stale hours"""
+        serializer = MeasuresGapsQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        start_datetime = data['start_datetime']
+        end_datetime = data['end_datetime']
+        stale_before = data.get('stale_before')
+        node_id = data.get('node_id')
+        grid_id = data.get('grid_id')
+        region_id = data.get('region_id')
+
+        nodes = GridNode.objects.select_related('region', 'region__grid')
+        if node_id:
+            nodes = nodes.filter(id=node_id)
+        if grid_id:
+            nodes = nodes.filter(region__grid_id=grid_id)
+        if region_id:
+            nodes = nodes.filter(region_id=region_id)
+        nodes = list(nodes.order_by('region__grid__name', 'region__name', 'name'))
+
+        expected_hours, gaps = find_gaps(nodes, start_datetime, end_datetime, stale_before)
+
+        return Response({
+            'start_datetime': start_datetime,
+            'end_datetime': end_datetime,
+            'stale_before': stale_before,
+            'expected_hours': expected_hours,
+            'nodes_with_gaps': sum(1 for gap in gaps if gap['missing_hours'] or gap['stale_hours']),
+            'results': [
+                {
+                    'node_id': gap['node'].id,
+                    'node_name': gap['node'].name,
+                    'region_name': gap['node'].region.name,
+                    'grid_name': gap['node'].region.grid.name,
+                    'missing_hours': gap['missing_hours'],
+                    'stale_hours': gap['stale_hours'],
+                    'missing': gap['missing'],
+                    'stale': gap['stale'],
+                }
+                for gap in gaps
+            ]
         })
 
 
+def job_response_data(request, job):
+    data = MeasuresQueryJobSerializer(job).data
+    data['status_url'] = request.build_absolute_uri(
+        reverse('measures-job-detail', args=[job.id])
+    )
+    data['result_url'] = request.build_absolute_uri(
+        reverse('measures-job-result', args=[job.id])
+    )
+    return data
+
+
+class MeasuresJobAPIView(APIView):
+    """
+    API endpoint for running measures queries in the background.
+
+    Accepts the same parameters as /measures/query/ plus an output format
+    (json, csv or parquet) and returns a job id right away.
+    """
+
+    def post(self, request):
+        """POST endpoint for submitting a query job"""
+        serializer = MeasuresJobCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        params = dict(serializer.data)
+        file_format = params.pop('format')
+        try:
+            job = jobs.submit_job(params, file_format)
+        except jobs.JobLimitExceeded as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+
+        return Response(job_response_data(request, job), status=status.HTTP_202_ACCEPTED)
+
+
+class MeasuresJobDetailAPIView(APIView):
+    """API endpoint for the status and progress of a query job"""
+
+    def get(self, request, job_id):
+        """GET endpoint for job status"""
+        job = get_object_or_404(MeasuresQueryJob, id=job_id)
+        return Response(job_response_data(request, job))
+
+
+class MeasuresJobResultAPIView(APIView):
+    """API endpoint for downloading the result file of a finished query job"""
+
+    def get(self, request, job_id):
+        """GET endpoint for job results"""
+        job = get_object_or_404(MeasuresQueryJob, id=job_id)
+        if job.status == MeasuresQueryJob.STATUS_FAILED:
+            return Response(
+                {'error': f'Job failed: {job.error}'},
+                status=status.HTTP_409_CONFLICT
+            )
+        if job.status != MeasuresQueryJob.STATUS_SUCCEEDED:
+            return Response(
+                {'error': 'Job has not finished yet', 'progress': job.progress},
+                status=status.HTTP_409_CONFLICT
+            )
+        if job.expires_at and job.expires_at <= timezone.now():
+            return Response({'error': 'Job result has expired'}, status=status.HTTP_410_GONE)
+        try:
+            result = open(job.result_path, 'rb')
+        except FileNotFoundError:
+            return Response({'error': 'Job result has expired'}, status=status.HTTP_410_GONE)
+        return FileResponse(result, as_attachment=True, filename=os.path.basename(job.result_path))
+
+
 class DashboardAPIView(APIView):
     """Dashboard API for overview statistics"""
     
@@ -200,5 +457,7 @@ class DashboardAPIView(APIView):
                 'total_measures': total_measures,
                 'measures_last_24h': measures_last_24h,
                 'latest_measure_timestamp': latest_timestamp,
-            }
+            },
+            # Per-process counters of the query coalescing layer
+            'single_flight': singleflight.get_metrics(),
         })
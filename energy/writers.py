@@ -0,0 +1,156 @@
+"""
+Batch file writers for measures exports.
+
+Every writer streams rows (tuples matching `columns`) into a temporary file
+next to the destination and only moves it into place on `close()`, so a
+reader never sees a half written file.
+"""
+import csv
+import gzip
+import io
+import os
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+COLUMNS = ['node_id', 'timestamp', 'collected_at', 'value']
+
+FILE_EXTENSIONS = {
+    'csv': 'csv.gz',
+    'json': 'json',
+    'parquet': 'parquet',
+}
+
+
+class BaseBatchWriter:
+    """Common temporary-file handling for the batch writers"""
+
+    def __init__(self, path, columns=COLUMNS):
+        self.path = str(path)
+        self.tmp_path = f'{self.path}.tmp'
+        self.columns = columns
+        self.rows_written = 0
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+    def write_batch(self, rows):
+        raise NotImplementedError
+
+    def _finish(self):
+        raise NotImplementedError
+
+    def close(self):
+        self._finish()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        try:
+            self._finish()
+        finally:
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class CsvBatchWriter(BaseBatchWriter):
+    """Gzip compressed CSV with a header row"""
+
+    def __init__(self, path, columns=COLUMNS):
+        super().__init__(path, columns)
+        self._file = io.TextIOWrapper(
+            gzip.open(self.tmp_path, 'wb', compresslevel=6),
+            encoding='utf-8', newline=''
+        )
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write_batch(self, rows):
+        self._writer.writerows(
+            [value.isoformat() if hasattr(value, 'isoformat') else value for value in row]
+            for row in rows
+        )
+        self.rows_written += len(rows)
+
+    def _finish(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class JsonBatchWriter(BaseBatchWriter):
+    """JSON array of objects, encoded the same way as the API responses"""
+
+    def __init__(self, path, columns=COLUMNS):
+        super().__init__(path, columns)
+        self._file = open(self.tmp_path, 'w', encoding='utf-8')
+        self._file.write('[')
+        self._encoder = DjangoJSONEncoder()
+
+    def write_batch(self, rows):
+        for row in rows:
+            if self.rows_written:
+                self._file.write(',')
+            self._file.write(self._encoder.encode(dict(zip(self.columns, row))))
+            self.rows_written += 1
+
+    def _finish(self):
+        if not self._file.closed:
+            self._file.write(']')
+            self._file.close()
+
+
+class ParquetBatchWriter(BaseBatchWriter):
+    """Parquet file with one row group per batch (requires pyarrow)"""
+
+    def __init__(self, path, columns=COLUMNS):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        super().__init__(path, columns)
+        types = {
+            'id': pa.string(),
+            'node_id': pa.string(),
+            'node_name': pa.string(),
+            'region_name': pa.string(),
+            'grid_name': pa.string(),
+            'timestamp': pa.timestamp('us', tz='UTC'),
+            'collected_at': pa.timestamp('us', tz='UTC'),
+            'value': pa.decimal128(15, 3),
+        }
+        self._pa = pa
+        self._schema = pa.schema([(name, types[name]) for name in columns])
+        self._writer = pq.ParquetWriter(self.tmp_path, self._schema, compression='snappy')
+
+    def write_batch(self, rows):
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        arrays = []
+        for field, values in zip(self._schema, columns):
+            if field.type == self._pa.string():
+                values = [None if value is None else str(value) for value in values]
+            arrays.append(self._pa.array(values, type=field.type))
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+        self.rows_written += len(rows)
+
+    def _finish(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+WRITERS = {
+    'csv': CsvBatchWriter,
+    'json': JsonBatchWriter,
+    'parquet': ParquetBatchWriter,
+}
+
+
+def get_writer(file_format, path, columns=COLUMNS):
+    """Return an open batch writer for `file_format`"""
+    return WRITERS[file_format](path, columns)
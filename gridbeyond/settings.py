@@ -123,6 +123,44 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Background measures query jobs
+# Results are written to MEASURES_JOBS_DIR and deleted MEASURES_JOBS_RESULT_TTL_HOURS
+# after the job finishes. At most MEASURES_JOBS_MAX_ACTIVE jobs may be pending or
+# running at once; MEASURES_JOBS_MAX_WORKERS of them run concurrently per process.
+# Every process refreshes the heartbeat of its jobs each MEASURES_JOBS_HEARTBEAT_SECONDS;
+# active jobs without one for MEASURES_JOBS_ABANDONED_SECONDS are failed.
+
+MEASURES_JOBS_DIR = config('MEASURES_JOBS_DIR', default=str(BASE_DIR / 'var' / 'measures_jobs'))
+MEASURES_JOBS_MAX_WORKERS = config('MEASURES_JOBS_MAX_WORKERS', default=2, cast=int)
+MEASURES_JOBS_MAX_ACTIVE = config('MEASURES_JOBS_MAX_ACTIVE', default=10, cast=int)
+MEASURES_JOBS_CHUNK_HOURS = config('MEASURES_JOBS_CHUNK_HOURS', default=24, cast=int)
+MEASURES_JOBS_RESULT_TTL_HOURS = config('MEASURES_JOBS_RESULT_TTL_HOURS', default=24, cast=int)
+MEASURES_JOBS_HEARTBEAT_SECONDS = config('MEASURES_JOBS_HEARTBEAT_SECONDS', default=30, cast=int)
+MEASURES_JOBS_ABANDONED_SECONDS = config('MEASURES_JOBS_ABANDONED_SECONDS', default=300, cast=int)
+
+# In-process hot window of latest measures (see energy/hotwindow.py)
+# MEASURES_HOT_WINDOW_DAYS trailing days (0 disables the store) plus
+# MEASURES_HOT_WINDOW_FORWARD_DAYS future days are kept in memory per process,
+# capped at MEASURES_HOT_WINDOW_MAX_MB by evicting the oldest days.
+
+MEASURES_HOT_WINDOW_DAYS = config('MEASURES_HOT_WINDOW_DAYS', default=0, cast=int)
+MEASURES_HOT_WINDOW_FORWARD_DAYS = config('MEASURES_HOT_WINDOW_FORWARD_DAYS', default=2, cast=int)
+MEASURES_HOT_WINDOW_MAX_MB = config('MEASURES_HOT_WINDOW_MAX_MB', default=256, cast=int)
+MEASURES_HOT_WINDOW_POLL_SECONDS = config('MEASURES_HOT_WINDOW_POLL_SECONDS', default=5, cast=int)
+
+# Single-flight coalescing of identical concurrent measures queries (see energy/singleflight.py)
+# MEASURES_SINGLE_FLIGHT_BACKEND is 'thread' (within a process), 'file' (across the
+# processes of a host, through lock files in MEASURES_SINGLE_FLIGHT_DIR) or 'none'.
+# Waiting requests run the query themselves after MEASURES_SINGLE_FLIGHT_TIMEOUT_SECONDS.
+
+MEASURES_SINGLE_FLIGHT_BACKEND = config('MEASURES_SINGLE_FLIGHT_BACKEND', default='thread')
+MEASURES_SINGLE_FLIGHT_DIR = config(
+    'MEASURES_SINGLE_FLIGHT_DIR', default=str(BASE_DIR / 'var' / 'single_flight')
+)
+MEASURES_SINGLE_FLIGHT_TIMEOUT_SECONDS = config(
+    'MEASURES_SINGLE_FLIGHT_TIMEOUT_SECONDS', default=30, cast=int
+)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gridbeyond.settings')
 
 application = get_wsgi_application()
+
+# Start loading the optional in-memory hot window of latest measures and the
+# thread that expires measures query job results
+from energy.hotwindow import warm_up  # noqa: E402
+from energy.jobs import start_maintenance  # noqa: E402
+
+warm_up()
+start_maintenance()